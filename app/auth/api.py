@@ -1,16 +1,21 @@
-from repositories.dependencies import user_service, personal_data_service, user_verify_service
+from repositories.dependencies import user_service, personal_data_service, user_verify_service, offer_service
 from auth.schemas import UserCreateSchema, UserLogin, Error, PersonalDataSchema, UserRead
-from repositories.services import Service
+from repositories.services import Service, OfferService
 from fastapi import APIRouter, Depends, Response, Header, Cookie, Body
 from auth.models import PersonalData, UserVerifyInfo
 from auth.hasher import Token, Hasher, AuthDependency
 from auth.refresh_session import RefreshSession
 from fastapi.responses import JSONResponse
+from starlette.concurrency import run_in_threadpool
 from tasks.message_data import MessageData
 from sqlalchemy.exc import IntegrityError
 from tasks.celery import send_email_task
 from typing import Annotated
+from offer.cache import OfferPublicCache
+from auth.principal import Principal
 from auth.models import User
+from offer.models import Offer, Executor
+from sqlalchemy import select, or_
 import datetime
 
 auth = APIRouter(prefix='/api/v1')
@@ -26,7 +31,7 @@ async def get_token(
     user: User = await _user_service.get(User.email == _user.email)
     if not user:
         return Response('User does not found by this email', status_code=404)
-    if not Hasher.is_correct_password(_user.password, user.password):
+    if not await Hasher.is_correct_password(_user.password, user.password):
         return Response('Incorrect password for user', status_code=403)
     access = Token.get_access_token(user)
     refresh_session = RefreshSession(_id=None, user_id=user.id, user_agent=user_agent, created_at=None)
@@ -73,7 +78,7 @@ async def logout(
         response: Response,
         user_agent: Annotated[str, Header()],
         refresh_token: Annotated[str, Cookie()] = None,
-        user: User = Depends(AuthDependency()),
+        user: Principal = Depends(AuthDependency()),
 ):
     refresh_session: RefreshSession = await RefreshSession.get(refresh_token)
 
@@ -93,20 +98,28 @@ async def create_user(
     try:
         user: User = await _user_service.add(
             email=_user.email,
-            password=Hasher.get_password_hash(_user.password))
+            password=await Hasher.get_password_hash(_user.password))
     except IntegrityError:
         return JSONResponse(Error(field_name='email', exception='Email field must\'be unique for User').model_dump(),
                             status_code=400)
     await _personal_data_service.add(id=user.id)
+    await _user_service.commit()
     return UserRead(id=user.id, email=user.email, personal_data=None)
 
 
 @auth.delete('/user', tags=['USER'])
 async def delete_user(
-        user: User = Depends(AuthDependency()),
-        _user_service: Service = Depends(user_service)
+        user: Principal = Depends(AuthDependency()),
+        _user_service: Service = Depends(user_service),
+        _offer_service: OfferService = Depends(offer_service)
 ):
-    await _user_service.delete(user)
+    _user: User = await user.user
+    if not _user:
+        return Response('User not found', status_code=404)
+    await _offer_service.bump_version(Offer.id.in_(select(Executor.offer_id).where(Executor.user_id == user.id)))
+    await _user_service.delete(_user)
+    await _user_service.commit()
+    await OfferPublicCache.delete_user_offers(user.id)
     return {'id': user.id, 'status': 'deleted'}
 
 
@@ -114,19 +127,31 @@ async def delete_user(
 async def update_personal_data(
         info: PersonalDataSchema,
         _personal_data_service: Service = Depends(personal_data_service),
-        user: User = Depends(AuthDependency()),
+        _offer_service: OfferService = Depends(offer_service),
+        user: Principal = Depends(AuthDependency()),
 ):
-    user_info: PersonalData = await _personal_data_service.update(User.id == user.id, **info.model_dump())
+    user_info: PersonalData = await _personal_data_service.update(PersonalData.id == user.id, **info.model_dump())
+    if not user_info:
+        return Response('Unauthorized', status_code=401)
+    # Owner's and executor's personal data are embedded in offer views
+    await _offer_service.bump_version(or_(
+        Offer.user_id == user.id,
+        Offer.id.in_(select(Executor.offer_id).where(Executor.user_id == user.id))
+    ))
+    await _personal_data_service.commit()
+    await OfferPublicCache.delete_user_offers(user.id)
     return user_info
 
 
 @auth.get('/email/verify', tags=['EMAILS'])
 async def get_verify_mail(
-        user: User = Depends(AuthDependency()),
+        user: Principal = Depends(AuthDependency()),
         _personal_data_service: Service = Depends(personal_data_service),
         _user_verify_service: Service = Depends(user_verify_service)
 ):
     personal_data: PersonalData = await _personal_data_service.get(PersonalData.id == user.id)
+    if not personal_data:
+        return Response('Unauthorized', status_code=401)
     if not personal_data.is_correct_data():
         return JSONResponse({'detail': "Missing required fields 'first_name', 'surname', 'tg_nickname'"},
                             status_code=400)
@@ -134,20 +159,22 @@ async def get_verify_mail(
         verify_info: UserVerifyInfo = await _user_verify_service.add(user_id=user.id)
     except IntegrityError:
         return JSONResponse({'error': 'User is verified'}, status_code=403)
+    await _user_verify_service.commit()
     message_data = MessageData(
         subject='Подтверждение личного аккаунта',
         recipient_email=user.email,
         template_type='verify_email',
         token=verify_info.id
     )
-    send_email_task(message_data)
+    # .delay() talks to the broker synchronously, keep it off the event loop
+    await run_in_threadpool(send_email_task.delay, message_data.to_dict())
     return JSONResponse({'detail': 'Verify Email is sent'})
 
 
 @auth.post('/email/verify', tags=['EMAILS'])
 async def verify_user(
         verify_token: str = Body(),
-        user: User = Depends(AuthDependency()),
+        user: Principal = Depends(AuthDependency()),
         _user_verify_service: Service = Depends(user_verify_service),
         _user_service: Service = Depends(user_service)
 ):
@@ -162,7 +189,16 @@ async def verify_user(
         UserVerifyInfo.user_id == user.id,
         verified_at=datetime.datetime.utcnow()
     )
-    await _user_service.update(User.id == user.id, is_verified=True)
-    return JSONResponse({'user': user.email, 'is_verified': True, 'verified_at': verify_info.verified_at})
+    verified_user: User = await _user_service.update(User.id == user.id, is_verified=True)
+    if not verified_user:
+        return Response('Unauthorized', status_code=401)
+    await _user_service.commit()
+    # Access tokens carry is_verified, hand out a fresh one so the client doesn't have to refresh
+    return JSONResponse({
+        'user': user.email,
+        'is_verified': True,
+        'verified_at': verify_info.verified_at.isoformat(),
+        'access_token': Token.get_access_token(verified_user),
+    })
 
 
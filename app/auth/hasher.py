@@ -1,31 +1,92 @@
-from core.config import ACCESS_TOKEN_TTL_MINUTES
-from fastapi import Header, Response, HTTPException
+from core.config import ACCESS_TOKEN_TTL_MINUTES, HASHER_MAX_WORKERS, HASHER_MAX_QUEUE
+from fastapi import Header, HTTPException, Depends
 from repositories.services import Service
 from repositories.dependencies import user_service
 from core.config import SECRET_KEY, ALGORITHM
+from concurrent.futures import ThreadPoolExecutor
 from passlib.context import CryptContext
 from datetime import timedelta, datetime
 from typing import Literal, Annotated
 from jose import jwt, JWTError
+from time import perf_counter
+from auth.principal import Principal
 from auth.models import User
+import asyncio
 
 pwd_context = CryptContext(schemes=['bcrypt'], deprecated='auto')
 
 
+class HasherPool:
+    """Bounded thread pool for bcrypt, so hashing never blocks the event loop.
+
+    bcrypt releases the GIL, at most `max_workers` hashes run in parallel and at most
+    `max_queue` more wait for a slot; anything beyond that is rejected with 503.
+    """
+    def __init__(self, max_workers: int, max_queue: int):
+        self.max_workers: int = max_workers
+        self.max_queue: int = max_queue
+        self.__executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='hasher')
+        self.__semaphore = asyncio.Semaphore(max_workers)
+        self.__running: int = 0
+        self.__queued: int = 0
+        self.__completed: int = 0
+        self.__rejected: int = 0
+        self.__wait_seconds: float = 0.0
+
+    async def run(self, func, *args):
+        if self.__queued >= self.max_queue:
+            self.__rejected += 1
+            raise HTTPException(status_code=503, detail='Too many concurrent password operations')
+        enqueued_at = perf_counter()
+        self.__queued += 1
+        try:
+            await self.__semaphore.acquire()
+        finally:
+            self.__queued -= 1
+        self.__wait_seconds += perf_counter() - enqueued_at
+        self.__running += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self.__executor, func, *args)
+        finally:
+            self.__running -= 1
+            self.__completed += 1
+            self.__semaphore.release()
+
+    @property
+    def stats(self) -> dict:
+        return {
+            'max_workers': self.max_workers,
+            'max_queue': self.max_queue,
+            'running': self.__running,
+            'queued': self.__queued,
+            'completed': self.__completed,
+            'rejected': self.__rejected,
+            'wait_seconds_total': self.__wait_seconds,
+        }
+
+
+hasher_pool = HasherPool(max_workers=HASHER_MAX_WORKERS, max_queue=HASHER_MAX_QUEUE)
+
+
 class Hasher:
     @staticmethod
-    def get_password_hash(password):
-        return pwd_context.hash(password)
+    async def get_password_hash(password):
+        return await hasher_pool.run(pwd_context.hash, password)
 
     @staticmethod
-    def is_correct_password(password, hash_password):
-        return pwd_context.verify(password, hash_password)
+    async def is_correct_password(password, hash_password):
+        return await hasher_pool.run(pwd_context.verify, password, hash_password)
 
 
 class Token:
     @staticmethod
     def _get_encode_token(user, token_type: Literal['access_token', 'refresh_token'], expires_in: timedelta):
-        payload = {'email': user.email, 'sub': token_type}
+        payload = {
+            'email': user.email,
+            'user_id': user.id.__str__(),
+            'is_verified': user.is_verified,
+            'sub': token_type,
+        }
         token_exp = datetime.utcnow() + expires_in
         payload.update({'exp': token_exp})
         return jwt.encode(payload, key=SECRET_KEY, algorithm=ALGORITHM)
@@ -41,16 +102,27 @@ class Token:
 
 
 class AuthDependency:
-    def __init__(self, is_strict: bool = True):
+    """Resolves the caller from the Authorization header.
+
+    Always resolves to a `Principal`. With `is_stateless` it is built from the token claims
+    without querying the database, otherwise (or for tokens issued before the claims were
+    added) the `User` row is loaded first. Stateless principals may outlive their user,
+    writes referencing `user.id` have to handle the missing row.
+    """
+    def __init__(self, is_strict: bool = True, is_stateless: bool = True):
         self.is_strict: bool = is_strict
-        self.service: Service = user_service()
+        self.is_stateless: bool = is_stateless
 
-    async def __call__(self, authorization: Annotated[str, Header()] = None):
+    async def __call__(
+            self,
+            authorization: Annotated[str, Header()] = None,
+            _user_service: Service = Depends(user_service),
+    ):
         if self.is_strict:
-            return await self.__strict_auth(authorization)
-        return await self.__soft_auth(authorization)
+            return await self.__strict_auth(authorization, _user_service)
+        return await self.__soft_auth(authorization, _user_service)
 
-    async def __strict_auth(self, authorization: str):
+    async def __strict_auth(self, authorization: str, _user_service: Service):
         if not authorization:
             raise HTTPException(status_code=401, detail='No access token')
         try:
@@ -60,13 +132,20 @@ class AuthDependency:
         expires_in = datetime.fromtimestamp(float(payload.get('exp')))
         if expires_in < datetime.utcnow():
             raise HTTPException(status_code=401, detail='Access token has expired')
-        user = await self.service.get(User.email == payload.get('email'))
+        if self.is_stateless and payload.get('user_id'):
+            return Principal(
+                user_id=payload.get('user_id'),
+                email=payload.get('email'),
+                is_verified=payload.get('is_verified', False),
+                service=_user_service,
+            )
+        user = await _user_service.get(User.email == payload.get('email'))
         if not user:
-            return Response('Unauthorized', status_code=401)
-        return user
+            raise HTTPException(status_code=401, detail='Unauthorized')
+        return Principal.from_user(user, _user_service)
 
-    async def __soft_auth(self, authorization: str | None):
+    async def __soft_auth(self, authorization: str | None, _user_service: Service):
         try:
-            return await self.__strict_auth(authorization)
+            return await self.__strict_auth(authorization, _user_service)
         except HTTPException:
             return None
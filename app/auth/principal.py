@@ -0,0 +1,34 @@
+from repositories.services import Service
+from auth.models import User
+from typing import Optional
+from uuid import UUID
+
+
+class Principal:
+    """Authenticated user built from access token claims without a database query.
+
+    Carries only what the token holds (id, email, is_verified). Handlers that need the
+    full row await `principal.user`, which is loaded once per request on first access.
+    """
+    def __init__(self, user_id: str, email: str, is_verified: bool, service: Service):
+        self.id: UUID = UUID(user_id)
+        self.email: str = email
+        self.is_verified: bool = is_verified
+        self.__service: Service = service
+        self.__user: Optional[User] = None
+
+    @classmethod
+    def from_user(cls, user: User, service: Service) -> 'Principal':
+        """Principal for an already loaded row, `user` is served from it without another query"""
+        principal = cls(user.id.__str__(), user.email, user.is_verified, service)
+        principal.__user = user
+        return principal
+
+    @property
+    async def user(self) -> Optional[User]:
+        if self.__user is None:
+            self.__user = await self.__service.get(User.id == self.id)
+        return self.__user
+
+    def __repr__(self):
+        return f'Principal(id={self.id}, email={self.email})'
@@ -0,0 +1,270 @@
+"""In-process stand-ins for Redis and S3 used by the HTTP benchmark.
+
+Only the commands the app issues are implemented. Values come back as bytes like
+aioredis without `decode_responses`, and the optional `latency` adds a fixed
+round trip to every call so network cost can be approximated.
+"""
+from repositories.s3_service import S3Service
+from repositories.cache import ServiceCache
+from core.redis import RedisService
+from collections import defaultdict
+from core.pubsub import pubsub_hub
+from core.metrics import metrics
+from datetime import timedelta
+from time import monotonic, time
+from typing import Dict
+import core.redis
+import asyncio
+
+
+def _bytes(value) -> bytes:
+    if isinstance(value, bytes):
+        return value
+    return str(value).encode()
+
+
+def _seconds(ttl) -> float:
+    return ttl.total_seconds() if isinstance(ttl, timedelta) else float(ttl)
+
+
+class FakeRedis:
+    def __init__(self, latency: float = 0.0):
+        self.latency: float = latency
+        self.data: Dict[str, object] = {}
+        self.expires: Dict[str, float] = {}
+        self.channels: Dict[str, set] = defaultdict(set)
+        self.__stream_seq: Dict[str, tuple] = {}
+
+    async def __round_trip(self):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+    def __live(self, key: str):
+        expires_at = self.expires.get(key)
+        if expires_at is not None and expires_at <= monotonic():
+            self.data.pop(key, None)
+            self.expires.pop(key, None)
+        return self.data.get(key)
+
+    # Commands without the round trip, shared by the client and pipelines
+
+    def _get(self, key):
+        return self.__live(key)
+
+    def _set(self, key, value, nx: bool = False, ex=None):
+        if nx and self.__live(key) is not None:
+            return None
+        self.data[key] = _bytes(value)
+        self.expires.pop(key, None)
+        if ex is not None:
+            self._expire(key, ex)
+        return True
+
+    def _setex(self, key, ttl, value):
+        return self._set(key, value, ex=ttl)
+
+    def _expire(self, key, ttl):
+        if self.__live(key) is None:
+            return False
+        self.expires[key] = monotonic() + _seconds(ttl)
+        return True
+
+    def _delete(self, *keys):
+        removed = 0
+        for key in keys:
+            key = key.decode() if isinstance(key, bytes) else key
+            removed += self.data.pop(key, None) is not None
+            self.expires.pop(key, None)
+        return removed
+
+    def _exists(self, *keys):
+        return sum(self.__live(key.decode() if isinstance(key, bytes) else key) is not None for key in keys)
+
+    def _mget(self, keys):
+        return [self.__live(key) for key in keys]
+
+    def _sadd(self, key, *members):
+        members = {_bytes(member) for member in members}
+        current = self.data.setdefault(key, set())
+        added = len(members - current)
+        current |= members
+        return added
+
+    def _smembers(self, key):
+        return set(self.__live(key) or ())
+
+    def _srem(self, key, *members):
+        current = self.__live(key) or set()
+        removed = {_bytes(member) for member in members} & current
+        current -= removed
+        return len(removed)
+
+    def _hincrbyfloat(self, key, field, amount):
+        current = self.data.setdefault(key, {})
+        field = _bytes(field)
+        value = float(current.get(field, 0)) + float(amount)
+        current[field] = _bytes(repr(value))
+        return value
+
+    def _hgetall(self, key):
+        return dict(self.__live(key) or {})
+
+    def _xadd(self, key, fields: dict, maxlen: int = None, approximate: bool = True):
+        entries = self.data.setdefault(key, [])
+        ms = int(time() * 1000)
+        last_ms, last_seq = self.__stream_seq.get(key, (0, -1))
+        seq = last_seq + 1 if ms <= last_ms else 0
+        ms = max(ms, last_ms)
+        self.__stream_seq[key] = (ms, seq)
+        entry_id = f'{ms}-{seq}'.encode()
+        entries.append((entry_id, {_bytes(k): _bytes(v) for k, v in fields.items()}))
+        if maxlen is not None and len(entries) > maxlen:
+            del entries[:len(entries) - maxlen]
+        return entry_id
+
+    def _xread(self, streams: dict, count: int = None, block: int = None):
+        res = []
+        for key, last_id in streams.items():
+            last = tuple(int(part) for part in str(last_id).split('-')) if last_id != '$' else (float('inf'),)
+            entries = [
+                entry for entry in self.__live(key) or []
+                if tuple(int(part) for part in entry[0].decode().split('-')) > last
+            ][:count]
+            if entries:
+                res.append((key.encode(), entries))
+        return res
+
+    def _xrange(self, key, min='-', max='+', count: int = None):
+        def position(entry_id, default):
+            return default if entry_id in ('-', '+') else tuple(int(part) for part in str(entry_id).split('-'))
+        low, high = position(min, (0, 0)), position(max, (float('inf'),))
+        entries = [
+            entry for entry in self.__live(key) or []
+            if low <= tuple(int(part) for part in entry[0].decode().split('-')) <= high
+        ]
+        return entries[:count] if count else entries
+
+    def _publish(self, channel, message):
+        channel = channel.decode() if isinstance(channel, bytes) else channel
+        for subscriber in tuple(self.channels.get(channel, ())):
+            subscriber.deliver(channel, _bytes(message))
+        return len(self.channels.get(channel, ()))
+
+    def __getattr__(self, name):
+        command = getattr(type(self), f'_{name}', None)
+        if command is None:
+            raise AttributeError(name)
+
+        async def call(*args, **kwargs):
+            await self.__round_trip()
+            return command(self, *args, **kwargs)
+        return call
+
+    def pipeline(self, transaction: bool = True):
+        return FakePipeline(self)
+
+    def pubsub(self, ignore_subscribe_messages: bool = False):
+        return FakePubSub(self)
+
+
+class FakePipeline:
+    def __init__(self, redis: FakeRedis):
+        self.redis: FakeRedis = redis
+        self.commands = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        self.commands.clear()
+
+    def __getattr__(self, name):
+        command = getattr(FakeRedis, f'_{name}')
+
+        def queue(*args, **kwargs):
+            self.commands.append((command, args, kwargs))
+            return self
+        return queue
+
+    async def execute(self):
+        if self.redis.latency:
+            await asyncio.sleep(self.redis.latency)
+        commands, self.commands = self.commands, []
+        return [command(self.redis, *args, **kwargs) for command, args, kwargs in commands]
+
+
+class FakePubSub:
+    def __init__(self, redis: FakeRedis):
+        self.redis: FakeRedis = redis
+        self.queue: asyncio.Queue = asyncio.Queue()
+
+    def deliver(self, channel: str, data: bytes):
+        self.queue.put_nowait({'type': 'message', 'channel': channel.encode(), 'data': data})
+
+    async def subscribe(self, *channels):
+        for channel in channels:
+            self.redis.channels[channel].add(self)
+
+    async def unsubscribe(self, *channels):
+        for channel in channels:
+            self.redis.channels[channel].discard(self)
+
+    async def get_message(self, ignore_subscribe_messages: bool = False, timeout: float = 0.0):
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    async def close(self):
+        for subscribers in self.redis.channels.values():
+            subscribers.discard(self)
+
+
+class FakeS3Client:
+    """Keeps uploaded objects in memory and signs URLs locally"""
+    class exceptions:
+        class ClientError(Exception):
+            def __init__(self, code: str):
+                super().__init__(code)
+                self.response = {'Error': {'Code': code}}
+
+    def __init__(self, latency: float = 0.0):
+        self.latency: float = latency
+        self.objects: Dict[str, int] = {}
+
+    async def __round_trip(self):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+    async def put_object(self, Bucket, Key, Body, **kwargs):
+        await self.__round_trip()
+        self.objects[Key] = len(Body)
+        return {'ETag': '"fake"'}
+
+    async def head_object(self, Bucket, Key):
+        await self.__round_trip()
+        if Key not in self.objects:
+            raise self.exceptions.ClientError('404')
+        return {'ContentLength': self.objects[Key]}
+
+    async def delete_object(self, Bucket, Key):
+        await self.__round_trip()
+        self.objects.pop(Key, None)
+        return {'ResponseMetadata': {'HTTPStatusCode': 204}}
+
+    async def generate_presigned_url(self, ClientMethod, Params, ExpiresIn):
+        return f'https://s3.bench/{Params["Bucket"]}/{Params["Key"]}?X-Amz-Expires={ExpiresIn}&X-Amz-Signature=0'
+
+    async def generate_presigned_post(self, Bucket, Key, Fields=None, Conditions=None, ExpiresIn=3600):
+        return {'url': f'https://s3.bench/{Bucket}', 'fields': {**(Fields or {}), 'key': Key}}
+
+
+def install(redis: FakeRedis, s3: FakeS3Client):
+    """Points every Redis and S3 user of the already imported app at the fakes"""
+    core.redis.redis = redis
+    RedisService.redis = redis
+    for cache in ServiceCache.registry.values():
+        cache.redis = redis
+    S3Service.use_client(s3, redis)
+    pubsub_hub.use_redis(redis)
+    metrics.redis = redis
@@ -0,0 +1,297 @@
+"""End-to-end HTTP benchmark of the FastAPI app over an in-process ASGI transport.
+
+Requires a real Postgres (point POSTGRES_* at a disposable database): the models use
+Postgres UUID columns and partial indexes and the queries LATERAL joins, so SQLite is
+not supported. Redis and S3 are the in-memory fakes from `benchmarks.fakes`.
+From the app directory:
+    python -m benchmarks.http_endpoints --reset -n 500 -c 20
+    python -m benchmarks.http_endpoints --skip-seed --compare benchmarks/results/<previous>.json
+
+`--reset` drops and recreates every table, `--skip-seed` reuses data loaded earlier
+(e.g. by `scripts.seed`). Results with p50/p95/p99 latency and req/s per scenario are
+written to benchmarks/results/ as JSON.
+"""
+from benchmarks.fakes import FakeRedis, FakeS3Client, install
+from typing import Awaitable, Callable, Dict, List, Optional
+from auth.models import User, PersonalData
+from chat.models import Chat, Message
+from core.database import async_engine, async_session, Base
+from offer.models import Offer, Category, OfferType, Executor, FileOffer
+from asgi_lifespan import LifespanManager
+from datetime import datetime, timedelta
+from auth.hasher import Hasher
+from sqlalchemy import select
+from time import perf_counter
+from main import app
+import subprocess
+import argparse
+import asyncio
+import random
+import httpx
+import json
+import os
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), 'results')
+# Same default as scripts.seed, so --skip-seed can log in to seeded data
+PASSWORD = 'seed-password'
+USER_AGENT = 'task-service-bench'
+
+
+async def reset_schema():
+    async with async_engine.begin() as connection:
+        await connection.run_sync(Base.metadata.drop_all)
+        await connection.run_sync(Base.metadata.create_all)
+
+
+async def seed(users: int, offers: int, seed_value: int, password: str):
+    """Small ORM-built dataset, one offer gets 50 executors and files to exercise the heavy views"""
+    rnd = random.Random(seed_value)
+    password = await Hasher.get_password_hash(password)
+    async with async_session() as session:
+        category, offer_type = Category(name='bench'), OfferType(type='bench')
+        people = [User(email=f'bench{i}@example.com', password=password, is_verified=True) for i in range(users)]
+        session.add_all([category, offer_type, *people])
+        await session.flush()
+        session.add_all(PersonalData(id=user.id, first_name=f'Name{i}', surname='Bench', tg_nickname=f'@b{i}')
+                        for i, user in enumerate(people))
+        now = datetime.utcnow()
+        for i in range(offers):
+            owner = people[0] if i == 0 else rnd.choice(people)
+            offer = Offer(
+                user_id=owner.id, title=f'Offer {i}', description='Benchmark offer', category_id=category.id,
+                type_id=offer_type.id, is_anonymous=False, deadline=now + timedelta(days=7),
+                created_at=now - timedelta(minutes=i),
+            )
+            session.add(offer)
+            await session.flush()
+            heavy = i == 0
+            session.add_all(
+                FileOffer(offer_id=offer.id, link=f'offers/{offer.id}/file{j}', storage_key=f'offers/{offer.id}/file{j}',
+                          description=f'File {j}')
+                for j in range(50 if heavy else 3)
+            )
+            candidates = [user for user in people if user.id != owner.id]
+            session.add_all(
+                Executor(user_id=user.id, offer_id=offer.id)
+                for user in (candidates[:50] if heavy else rnd.sample(candidates, min(3, len(candidates))))
+            )
+        await session.flush()
+        executor = await session.scalar(
+            select(Executor).join(Offer, Offer.id == Executor.offer_id)
+            .where(Offer.user_id == people[0].id).order_by(Offer.created_at.desc()).limit(1)
+        )
+        chat = Chat(chat_name='bench', offer_id=executor.offer_id, executor_id=executor.id, last_message_at=now)
+        session.add(chat)
+        await session.flush()
+        session.add_all(
+            Message(owner_id=people[0].id, recipient_id=executor.user_id, chat_id=chat.id, content=f'Message {i}',
+                    created_at=now - timedelta(seconds=i))
+            for i in range(200)
+        )
+        await session.commit()
+
+
+async def fixtures(session_factory) -> dict:
+    """Ids the scenarios need, read back so `--skip-seed` works with any dataset"""
+    async with session_factory() as session:
+        chat = await session.scalar(select(Chat).order_by(Chat.last_message_at.desc()).limit(1))
+        executor = await session.get(Executor, chat.executor_id)
+        offer = await session.get(Offer, chat.offer_id)
+        owner = await session.get(User, offer.user_id)
+        offer_ids = (await session.scalars(select(Offer.id).order_by(Offer.created_at.desc()).limit(500))).all()
+    return {
+        'owner_email': owner.email,
+        'private_offer_id': str(offer.id),
+        'offer_ids': [str(offer_id) for offer_id in offer_ids],
+        'chat_id': str(chat.id),
+        'recipient_id': str(executor.user_id),
+    }
+
+
+async def sse_connect(path: str, query: str) -> int:
+    """Time to response start of an SSE stream, then disconnects. Drives the ASGI app directly
+    because the ASGI transport waits for the whole body, which an event stream never finishes."""
+    started, disconnected = asyncio.Event(), asyncio.Event()
+    status = {}
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET', 'scheme': 'http',
+        'path': path, 'raw_path': path.encode(), 'query_string': query.encode(), 'root_path': '',
+        'headers': [(b'host', b'bench'), (b'accept', b'text/event-stream')],
+        'client': ('127.0.0.1', 0), 'server': ('bench', 80),
+    }
+
+    async def receive():
+        await disconnected.wait()
+        return {'type': 'http.disconnect'}
+
+    async def send(message):
+        if message['type'] == 'http.response.start':
+            status['code'] = message['status']
+            started.set()
+
+    task = asyncio.create_task(app(scope, receive, send))
+    try:
+        await asyncio.wait_for(started.wait(), 10)
+    finally:
+        disconnected.set()
+        await task
+    return status['code']
+
+
+def percentile(values: List[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(int(round(q / 100 * len(ordered))) - 1, 0))]
+
+
+async def run_scenario(request: Callable[[int], Awaitable[int]], n: int, concurrency: int, warmup: int) -> dict:
+    for i in range(warmup):
+        await request(i)
+    latencies, statuses = [], {}
+    counter = iter(range(n))
+
+    async def worker():
+        for i in counter:
+            started = perf_counter()
+            status = await request(i)
+            latencies.append(perf_counter() - started)
+            statuses[status] = statuses.get(status, 0) + 1
+
+    started = perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = perf_counter() - started
+    return {
+        'requests': n,
+        'errors': sum(count for status, count in statuses.items() if status >= 400),
+        'statuses': {str(status): count for status, count in sorted(statuses.items())},
+        'rps': n / elapsed,
+        'p50_ms': percentile(latencies, 50) * 1000,
+        'p95_ms': percentile(latencies, 95) * 1000,
+        'p99_ms': percentile(latencies, 99) * 1000,
+        'mean_ms': sum(latencies) / len(latencies) * 1000,
+        'max_ms': max(latencies) * 1000,
+    }
+
+
+def scenarios(client: httpx.AsyncClient, data: dict, token: str, message_token: str,
+              password: str) -> Dict[str, Callable]:
+    auth = {'authorization': token}
+    offer_ids = data['offer_ids']
+
+    async def login(_):
+        res = await client.post('/api/v1/auth/token', json={'email': data['owner_email'], 'password': password},
+                                headers={'user-agent': USER_AGENT})
+        return res.status_code
+
+    async def offer_feed(_):
+        return (await client.get('/api/v1/offers/main', params={'limit': 20})).status_code
+
+    async def offer_feed_sparse(_):
+        res = await client.get('/api/v1/offers/main', params={'limit': 20, 'fields': 'id,title,created_at'})
+        return res.status_code
+
+    async def public_offer(i):
+        return (await client.get(f'/api/v1/offer/public/{offer_ids[i % len(offer_ids)]}')).status_code
+
+    async def private_offer(_):
+        return (await client.get(f'/api/v1/offer/private/{data["private_offer_id"]}', headers=auth)).status_code
+
+    async def post_message(i):
+        res = await client.post(f'/api/v1/chat/{data["chat_id"]}/msg', headers=auth,
+                                json={'content': f'Benchmark message {i}', 'recipient_id': data['recipient_id']})
+        return res.status_code
+
+    async def sse(_):
+        return await sse_connect('/api/v1/notification/stream', f'token={message_token}')
+
+    return {
+        'login': login,
+        'offer_feed': offer_feed,
+        'offer_feed_sparse': offer_feed_sparse,
+        'public_offer': public_offer,
+        'private_offer': private_offer,
+        'post_message': post_message,
+        'sse_connect': sse,
+    }
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results: dict, previous_path: str):
+    with open(previous_path) as f:
+        previous = json.load(f)['results']
+    print(f'\nvs {previous_path}')
+    for name, current in results.items():
+        before = previous.get(name)
+        if not before:
+            continue
+        print(f'{name:<18} p95 {(current["p95_ms"] / before["p95_ms"] - 1) * 100:+7.1f}%  '
+              f'rps {(current["rps"] / before["rps"] - 1) * 100:+7.1f}%')
+
+
+async def main(args):
+    install(FakeRedis(latency=args.redis_latency), FakeS3Client(latency=args.s3_latency))
+    if args.reset:
+        await reset_schema()
+    if not args.skip_seed:
+        await seed(args.users, args.offers, args.seed, args.password)
+    data = await fixtures(async_session)
+    results = {}
+    async with LifespanManager(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url='http://bench') as client:
+            res = await client.post('/api/v1/auth/token', json={'email': data['owner_email'], 'password': args.password},
+                                    headers={'user-agent': USER_AGENT})
+            # Authenticated scenarios would silently measure 401s with a bad token
+            assert res.status_code == 200, f'Login as {data["owner_email"]} failed: {res.status_code} {res.text}'
+            token = res.json()
+            res = await client.get('/api/v1/notification/token', headers={'authorization': token})
+            assert res.status_code == 200, f'Message token request failed: {res.status_code} {res.text}'
+            message_token = res.json()['message_token']
+            for name, request in scenarios(client, data, token, message_token, args.password).items():
+                if args.only and name not in args.only:
+                    continue
+                # bcrypt dominates login, a full run would mostly measure the hasher pool
+                n = min(args.n, args.login_n) if name == 'login' else args.n
+                results[name] = await run_scenario(request, n, args.c, args.warmup)
+                r = results[name]
+                print(f'{name:<18} {r["rps"]:8.1f} req/s  p50 {r["p50_ms"]:7.2f}  p95 {r["p95_ms"]:7.2f}  '
+                      f'p99 {r["p99_ms"]:7.2f} ms  errors {r["errors"]}')
+
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    commit = git_commit()
+    path = os.path.join(RESULTS_DIR, f'http-{datetime.utcnow():%Y%m%dT%H%M%S}-{commit or "nogit"}.json')
+    with open(path, 'w') as f:
+        json.dump({
+            'commit': commit,
+            'created_at': datetime.utcnow().isoformat(),
+            'config': {'n': args.n, 'concurrency': args.c, 'warmup': args.warmup, 'redis_latency': args.redis_latency,
+                       's3_latency': args.s3_latency},
+            'results': results,
+        }, f, indent=2)
+    print(f'saved {path}')
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('-n', type=int, default=500, help='requests per scenario')
+    parser.add_argument('-c', type=int, default=20, help='concurrent clients')
+    parser.add_argument('--warmup', type=int, default=20)
+    parser.add_argument('--login-n', type=int, default=50, help='requests for the bcrypt-bound login scenario')
+    parser.add_argument('--only', nargs='*', help='scenario names to run')
+    parser.add_argument('--reset', action='store_true', help='drop and recreate every table first')
+    parser.add_argument('--skip-seed', action='store_true', help='reuse the data already in the database')
+    parser.add_argument('--users', type=int, default=60)
+    parser.add_argument('--offers', type=int, default=200)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--password', default=PASSWORD, help='password of every user, as given to scripts.seed')
+    parser.add_argument('--redis-latency', type=float, default=0.0, help='seconds added to every Redis call')
+    parser.add_argument('--s3-latency', type=float, default=0.0, help='seconds added to every S3 call')
+    parser.add_argument('--compare', help='previous results JSON to diff against')
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,91 @@
+"""Per-offer serialization cost of the OfferPublic/OfferPrivate views.
+
+From the app directory:
+    python -m benchmarks.serialize_offers --executors 50 --files 50 -n 500
+
+Compares the validated path (view built with full validation, then FastAPI's
+jsonable_encoder + json.dumps) with the trusted path (model_construct + to_json).
+"""
+from offer.schemas import OfferPublic, OfferPrivate
+from fastapi.encoders import jsonable_encoder
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+from time import perf_counter
+from uuid import uuid4
+import argparse
+import json
+
+
+def fake_user(i: int):
+    return SimpleNamespace(
+        id=uuid4(),
+        email=f'user{i}@example.com',
+        personal_data=SimpleNamespace(
+            first_name=f'Name{i}', patronymic='Patronymic', surname=f'Surname{i}',
+            bio='Lorem ipsum dolor sit amet ' * 4, tg_nickname=f'@user{i}'
+        ),
+    )
+
+
+def fake_offer(executors: int, files: int):
+    owner = fake_user(0)
+    offer_id = uuid4()
+    return SimpleNamespace(
+        id=offer_id,
+        user_id=owner.id,
+        user=owner,
+        title='Offer title',
+        description='Offer description ' * 20,
+        category_id=uuid4(),
+        type_id=uuid4(),
+        is_anonymous=False,
+        is_closed=False,
+        deadline=datetime.utcnow() + timedelta(days=7),
+        created_at=datetime.utcnow(),
+        files=[
+            SimpleNamespace(
+                id=uuid4(), offer_id=offer_id, link=f'https://disk.yandex.ru/file{i}',
+                description=f'File {i}', storage_key=f'offers/{offer_id}/file{i}'
+            ) for i in range(files)
+        ],
+        executors=[
+            SimpleNamespace(id=uuid4(), user_id=user.id, offer_id=offer_id, is_approved=i % 2 == 0, user=user)
+            for i, user in enumerate(fake_user(i) for i in range(1, executors + 1))
+        ],
+    )
+
+
+def validated(view, offer, urls) -> bytes:
+    return json.dumps(jsonable_encoder(view(offer, urls, trusted=False))).encode()
+
+
+def trusted(view, offer, urls) -> bytes:
+    return view(offer, urls).to_json()
+
+
+def measure(fn, view, offer, urls, n: int) -> float:
+    fn(view, offer, urls)
+    started = perf_counter()
+    for _ in range(n):
+        fn(view, offer, urls)
+    return (perf_counter() - started) / n
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--executors', type=int, default=50)
+    parser.add_argument('--files', type=int, default=50)
+    parser.add_argument('-n', type=int, default=500, help='iterations per path')
+    args = parser.parse_args()
+
+    offer = fake_offer(args.executors, args.files)
+    urls = {file.storage_key: f'https://storage.example.com/{file.storage_key}?X-Amz-Signature=0' for file in offer.files}
+    print(f'{args.executors} executors, {args.files} files, {args.n} iterations')
+    for name, view in [('OfferPublic', OfferPublic.offer_public_view), ('OfferPrivate', OfferPrivate.offer_private_view)]:
+        slow = measure(validated, view, offer, urls, args.n)
+        fast = measure(trusted, view, offer, urls, args.n)
+        print(f'{name:<13} validated {slow * 1e6:9.1f} us  trusted {fast * 1e6:9.1f} us  x{slow / fast:.1f}')
+
+
+if __name__ == '__main__':
+    main()
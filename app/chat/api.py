@@ -1,18 +1,23 @@
 from repositories.dependencies import chat_service, executor_service, message_service
 from chat.schemas import ChatSchema, MessageSchema, Notification
-from fastapi import APIRouter, Depends, Response, Request
-from core.config import REDIS_MESSAGE_CHANNEL
+from fastapi import APIRouter, Depends, Response, Header, Query
+from chat.notification_stream import NotificationStream
+from core.pubsub import pubsub_hub, Subscription
+from core.config import REDIS_MESSAGE_CHANNEL, MESSAGE_PAGE_SIZE_DEFAULT, MESSAGE_PAGE_SIZE_MAX
+from core.config import PAGE_SIZE_DEFAULT, PAGE_SIZE_MAX
+from typing import Annotated, Optional
+from uuid import UUID
 from chat.message_token import MessageToken
-from repositories.services import Service
+from repositories.services import Service, ChatService
 from offer.models import Offer, Executor
 from sqlalchemy.orm import selectinload
 from auth.hasher import AuthDependency
-from core.redis import redis_session
+from auth.principal import Principal
 from auth.models import User
-from chat.models import Chat
-from aioredis import Redis
+from chat.models import Chat, Message
 import sse_starlette
-import async_timeout
+import anyio
+import json
 
 chat_api = APIRouter(prefix='/api/v1')
 
@@ -20,7 +25,7 @@ chat_api = APIRouter(prefix='/api/v1')
 @chat_api.post('/chat', tags=['CHAT'])
 async def create_chat(
         _chat: ChatSchema,
-        user: User = Depends(AuthDependency()),
+        user: Principal = Depends(AuthDependency()),
         _executor_service: Service = Depends(executor_service),
         _chat_service: Service = Depends(chat_service)
 ):
@@ -40,13 +45,14 @@ async def create_chat(
         offer_id=offer.id,
         executor_id=executor.id
     )
+    await _chat_service.commit()
     return chat
 
 
 @chat_api.delete('/chat/{chat_id}', tags=['CHAT'])
 async def delete_chat(
-        chat_id: str,
-        user: User = Depends(AuthDependency()),
+        chat_id: UUID,
+        user: Principal = Depends(AuthDependency()),
         _chat_service: Service = Depends(chat_service)
 ):
     chat = await _chat_service.get_with_options(selectinload(Chat.offer), Chat.id == chat_id)
@@ -56,46 +62,111 @@ async def delete_chat(
     if offer.user_id != user.id:
         return Response('Forbidden', status_code=403)
     await _chat_service.delete(chat)
+    await _chat_service.commit()
     return {'id': chat.id, 'status': 'deleted'}
 
 
 @chat_api.post('/chat/{chat_id}/msg', tags=['CHAT+MESSAGE'])
 async def post_message(
-        chat_id: str,
+        chat_id: UUID,
         _message: MessageSchema,
-        user: User = Depends(AuthDependency()),
+        user: Principal = Depends(AuthDependency()),
         _chat_service: Service = Depends(chat_service),
         _message_service: Service = Depends(message_service),
-        redis: Redis = Depends(redis_session)
 ):
     chat = await _chat_service.get_with_options(
-        selectinload(Chat.offer), Chat.id == chat_id
+        [selectinload(Chat.offer), selectinload(Chat.executor)], Chat.id == chat_id
     )
     if not chat:
         return Response('Not found', status_code=404)
-    if user.id not in [chat.offer.user_id, chat.executor_id]:
+    # Chat.executor_id points at the executors row, the participant is its user
+    if user.id not in [chat.offer.user_id, chat.executor.user_id]:
         return Response('Forbidden', status_code=403)
-    recipient_id = chat.offer.user_id if user.id == chat.executor_id else chat.executor_id
+    recipient_id = chat.offer.user_id if user.id == chat.executor.user_id else chat.executor.user_id
     message = await _message_service.add(
         owner_id=user.id,
-        resipient_id=recipient_id,
+        recipient_id=recipient_id,
         chat_id=chat.id,
         content=_message.content
     )
+    await _chat_service.update(Chat.id == chat.id, last_message_at=message.created_at)
+    await _message_service.commit()
     redis_message = Notification(
         event='message', user_id=recipient_id,
         source={'chat_id': chat.id}, description=f'New message from {user.email}'
     )
-    await redis.publish(
-        f'{REDIS_MESSAGE_CHANNEL}:{recipient_id}',
-        str(redis_message),
-    )
+    await NotificationStream.push(recipient_id, redis_message)
     return message
 
 
+@chat_api.get('/chat/{chat_id}/messages', tags=['CHAT+MESSAGE'])
+async def get_messages(
+        chat_id: UUID,
+        before: Optional[UUID] = None,
+        after: Optional[UUID] = None,
+        limit: int = Query(MESSAGE_PAGE_SIZE_DEFAULT, ge=1, le=MESSAGE_PAGE_SIZE_MAX),
+        user: Principal = Depends(AuthDependency()),
+        _chat_service: ChatService = Depends(chat_service),
+        _message_service: Service = Depends(message_service),
+):
+    """Page of chat history in chronological order, before/after take a message id"""
+    if before and after:
+        return Response('Only one of before and after is allowed', status_code=400)
+    chat = await _chat_service.get_with_options(
+        [selectinload(Chat.offer), selectinload(Chat.executor)], Chat.id == chat_id
+    )
+    if not chat:
+        return Response('Not found', status_code=404)
+    if user.id not in [chat.offer.user_id, chat.executor.user_id]:
+        return Response('Forbidden', status_code=403)
+    try:
+        messages, has_more = await _message_service.select_window(
+            limit, Message.chat_id == chat.id,
+            before=before, after=after,
+            columns=[Message.id, Message.owner_id, Message.content, Message.created_at],
+        )
+    except LookupError:
+        return Response('Message not found', status_code=404)
+    return {'items': messages, 'has_more': has_more}
+
+
+@chat_api.get('/chats', tags=['CHAT'])
+async def get_chats(
+        cursor: str = None,
+        limit: int = Query(PAGE_SIZE_DEFAULT, ge=1, le=PAGE_SIZE_MAX),
+        user: Principal = Depends(AuthDependency()),
+        _chat_service: ChatService = Depends(chat_service),
+):
+    """Inbox: user's chats by last activity with last message preview and unread count"""
+    try:
+        chats, next_cursor = await _chat_service.select_inbox(user.id, limit, cursor)
+    except ValueError as e:
+        return Response(e.__str__(), status_code=400)
+    return {'items': chats, 'next_cursor': next_cursor}
+
+
+@chat_api.post('/chat/{chat_id}/read', tags=['CHAT+MESSAGE'])
+async def read_chat(
+        chat_id: UUID,
+        user: Principal = Depends(AuthDependency()),
+        _chat_service: ChatService = Depends(chat_service),
+):
+    """Marks every message addressed to the user in the chat as read"""
+    chat = await _chat_service.get_with_options(
+        [selectinload(Chat.offer), selectinload(Chat.executor)], Chat.id == chat_id
+    )
+    if not chat:
+        return Response('Not found', status_code=404)
+    if user.id not in [chat.offer.user_id, chat.executor.user_id]:
+        return Response('Forbidden', status_code=403)
+    await _chat_service.mark_read(chat.id, user.id)
+    await _chat_service.commit()
+    return {'id': chat_id, 'status': 'read'}
+
+
 @chat_api.get('/notification/token')
 async def get_message_token(
-        user: User = Depends(AuthDependency())
+        user: Principal = Depends(AuthDependency())
 ):
     message_token: MessageToken = MessageToken(user_id=user.id.__str__())
     await message_token.push()
@@ -105,25 +176,45 @@ async def get_message_token(
 @chat_api.get('/notification/stream')
 async def sse_notification(
         token: str,
-        request: Request,
-        redis: Redis = Depends(redis_session),
+        last_event_id: Annotated[str | None, Header()] = None,
 ):
     try:
         message_token: MessageToken = await MessageToken.get(token)
     except ValueError:
         return Response('Message Token has expired', status_code=400)
     user: User = await message_token.user
-    pb = redis.pubsub()
-    await pb.subscribe(f'{REDIS_MESSAGE_CHANNEL}:{user.id}')
+    # Subscribe before reading the log so nothing published in between is lost
+    subscription: Subscription = await pubsub_hub.subscribe(f'{REDIS_MESSAGE_CHANNEL}:{user.id}')
+    try:
+        missed = await NotificationStream.get(user.id, last_event_id)
+    except Exception:
+        await pubsub_hub.unsubscribe(subscription)
+        raise
 
     async def event_stream():
-        while True:
-            if await request.is_disconnected():
-                await pb.unsubscribe(f'{REDIS_MESSAGE_CHANNEL}:{user.id}')
-                break
-            async with async_timeout.timeout(10):
-                message: dict = await pb.get_message(ignore_subscribe_messages=True)
-                if message:
-                    yield message.get('data')
+        # EventSourceResponse cancels the generator when the client disconnects
+        last_id = last_event_id
+        try:
+            for event in missed:
+                last_id = event.get('id', last_id)
+                yield event
+            while True:
+                data = await subscription.get()
+                if subscription.take_overflow():
+                    # The queue dropped messages, fill the hole from the stream log
+                    replay = await NotificationStream.get(user.id, last_id)
+                    for event in replay or [{'event': 'resync', 'data': ''}]:
+                        last_id = event.get('id', last_id)
+                        yield event
+                event = json.loads(data)
+                if not NotificationStream.is_newer(event['id'], last_id):
+                    continue
+                last_id = event['id']
+                yield event
+        finally:
+            # The generator is stopped by cancelling its task group, an unshielded await here
+            # would be cancelled as well and leak the subscription
+            with anyio.CancelScope(shield=True):
+                await pubsub_hub.unsubscribe(subscription)
 
     return sse_starlette.EventSourceResponse(event_stream())
@@ -1,7 +1,8 @@
 from auth.models import User
 from core.redis import RedisService
 from core.config import MESSAGE_TOKEN_KEY, MESSAGE_TOKEN_TTL_SECONDS
-from repositories.dependencies import user_service
+from repositories.repositories import UserRepository
+from core.database import async_session
 from uuid import uuid4
 
 
@@ -26,7 +27,9 @@ class MessageToken(RedisService):
 
     @property
     async def user(self):
-        return await user_service().get(User.id == self.__user_id)
+        # Used by long-lived SSE streams, so it must not hold a request-scoped session open
+        async with async_session() as session:
+            return await UserRepository(session).get(User.id == self.__user_id)
 
     @property
     def id(self):
@@ -1,34 +1,54 @@
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 from sqlalchemy.dialects.postgresql import UUID
 from core.database import Base
-from offer.models import Offer
+from offer.models import Offer, Executor
 from datetime import datetime
 from typing import List
+from uuid import uuid4
 import sqlalchemy
 
 
 class Chat(Base):
     __tablename__ = 'chats'
 
-    id: Mapped[UUID] = mapped_column(UUID(as_uuid=True), primary_key=True)
+    id: Mapped[UUID] = mapped_column(UUID(as_uuid=True), primary_key=True, default=uuid4)
     chat_name: Mapped[str] = mapped_column(sqlalchemy.String(255))
     offer_id: Mapped[UUID] = mapped_column(sqlalchemy.ForeignKey('offers.id', ondelete='CASCADE'))
     executor_id: Mapped[UUID] = mapped_column(sqlalchemy.ForeignKey('executors.id', ondelete='CASCADE'))
     created_at: Mapped[datetime] = mapped_column(sqlalchemy.DateTime, default=datetime.utcnow)
+    last_message_at: Mapped[datetime] = mapped_column(
+        sqlalchemy.DateTime, default=datetime.utcnow, server_default=sqlalchemy.text("timezone('utc', now())"),
+        nullable=False
+    )
 
     offer: Mapped['Offer'] = relationship('Offer', backref='chats')
+    executor: Mapped['Executor'] = relationship('Executor')
     messages: Mapped[List['Message']] = relationship('Message', back_populates='chat')
 
+    __table_args__ = (
+        sqlalchemy.Index('ix_chats_offer_id', 'offer_id'),
+        sqlalchemy.Index('ix_chats_executor_id', 'executor_id'),
+    )
+
 
 class Message(Base):
     __tablename__ = 'messages'
 
-    id: Mapped[UUID] = mapped_column(UUID(as_uuid=True), primary_key=True)
+    id: Mapped[UUID] = mapped_column(UUID(as_uuid=True), primary_key=True, default=uuid4)
     owner_id: Mapped[UUID] = mapped_column(sqlalchemy.ForeignKey('users.id', ondelete='CASCADE'))
     recipient_id: Mapped[UUID] = mapped_column(sqlalchemy.ForeignKey('users.id', ondelete='CASCADE'))
     chat_id: Mapped[UUID] = mapped_column(sqlalchemy.ForeignKey('chats.id', ondelete='CASCADE'))
     content: Mapped[str] = mapped_column(sqlalchemy.String(255))
     created_at: Mapped[datetime] = mapped_column(sqlalchemy.DateTime, default=datetime.utcnow)
+    read_at: Mapped[datetime] = mapped_column(sqlalchemy.DateTime, nullable=True)
 
     chat: Mapped['Chat'] = relationship('Chat', back_populates='messages')
 
+    __table_args__ = (
+        sqlalchemy.Index('ix_messages_chat_created_at', 'chat_id', 'created_at', 'id'),
+        sqlalchemy.Index(
+            'ix_messages_unread_recipient_chat', 'recipient_id', 'chat_id',
+            postgresql_where=sqlalchemy.text('read_at IS NULL'),
+        ),
+    )
+
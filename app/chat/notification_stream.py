@@ -0,0 +1,78 @@
+from core.config import NOTIFICATION_STREAM_KEY, NOTIFICATION_STREAM_MAXLEN, NOTIFICATION_STREAM_TTL_SECONDS
+from core.config import NOTIFICATION_REPLAY_LIMIT, REDIS_MESSAGE_CHANNEL
+from typing import List, Optional, Tuple
+from core.redis import RedisService
+from chat.schemas import Notification
+import json
+import re
+
+STREAM_ID_PATTERN = re.compile(r'^\d+-\d+$')
+
+
+class NotificationStream(RedisService):
+    """Per-user capped Redis Stream used as the notification log.
+
+    Entry ids double as SSE event ids, a reconnecting client sends the last one it saw
+    as `Last-Event-ID` and gets only the newer entries back from a single XREAD.
+    """
+
+    @classmethod
+    async def push(cls, user_id, notification: Notification) -> str:
+        key = f'{NOTIFICATION_STREAM_KEY}:{user_id}'
+        data = str(notification)
+        async with cls.redis.pipeline(transaction=True) as pipe:
+            pipe.xadd(key, {'event': notification.event, 'data': data},
+                      maxlen=NOTIFICATION_STREAM_MAXLEN, approximate=True)
+            pipe.expire(key, NOTIFICATION_STREAM_TTL_SECONDS)
+            entry_id, _ = await pipe.execute()
+        entry_id = entry_id.decode() if isinstance(entry_id, bytes) else entry_id
+        await cls.redis.publish(
+            f'{REDIS_MESSAGE_CHANNEL}:{user_id}',
+            json.dumps({'id': entry_id, 'event': notification.event, 'data': data}),
+        )
+        return entry_id
+
+    @classmethod
+    async def get(cls, user_id, last_event_id: Optional[str]) -> List[dict]:
+        """Every retained entry newer than `last_event_id`, read in pages of NOTIFICATION_REPLAY_LIMIT.
+
+        Starts with a `resync` event when entries after `last_event_id` may have been trimmed
+        (MAXLEN or expiry), the client has to reload its state instead of trusting the replay.
+        """
+        if not last_event_id or not STREAM_ID_PATTERN.match(last_event_id):
+            return []
+        key = f'{NOTIFICATION_STREAM_KEY}:{user_id}'
+        events = [{'event': 'resync', 'data': ''}] if await cls.__has_gap(key, last_event_id) else []
+        cursor = last_event_id
+        while True:
+            res = await cls.redis.xread({key: cursor}, count=NOTIFICATION_REPLAY_LIMIT)
+            page = [entry for _, entries in res for entry in entries]
+            for entry_id, fields in page:
+                fields = {k.decode(): v.decode() for k, v in fields.items()}
+                events.append({'id': entry_id.decode(), 'event': fields.get('event'), 'data': fields.get('data')})
+            if len(page) < NOTIFICATION_REPLAY_LIMIT:
+                return events
+            cursor = events[-1]['id']
+
+    @classmethod
+    async def __has_gap(cls, key: str, last_event_id: str) -> bool:
+        """True unless the client's last entry is still retained or nothing older than it was dropped"""
+        if await cls.redis.xrange(key, min=last_event_id, max=last_event_id):
+            return False
+        oldest = await cls.redis.xrange(key, count=1)
+        if not oldest:
+            return True
+        oldest_id = oldest[0][0]
+        oldest_id = oldest_id.decode() if isinstance(oldest_id, bytes) else oldest_id
+        return _stream_id_key(oldest_id) > _stream_id_key(last_event_id)
+
+    @staticmethod
+    def is_newer(entry_id: str, last_event_id: Optional[str]) -> bool:
+        if not last_event_id or not STREAM_ID_PATTERN.match(last_event_id):
+            return True
+        return _stream_id_key(entry_id) > _stream_id_key(last_event_id)
+
+
+def _stream_id_key(entry_id: str) -> Tuple[int, int]:
+    ms, seq = entry_id.split('-')
+    return int(ms), int(seq)
@@ -30,8 +30,8 @@ class MessageSchema(BaseModel):
 
 class Notification(BaseModel):
     event: Literal['message', 'service_notify']
-    retry: int
-    data: dict
+    retry: Optional[int] = None
+    data: Optional[dict] = None
     user_id: UUID
     source: Optional[dict[str, Any]]
     description: Optional[str]
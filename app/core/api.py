@@ -0,0 +1,19 @@
+from core.database import pool_stats, replica_set
+from fastapi.responses import PlainTextResponse
+from core.metrics import metrics
+from fastapi import APIRouter
+
+system_api = APIRouter(prefix='/api/v1')
+metrics_api = APIRouter()
+
+
+@system_api.get('/system/pool', tags=['SYSTEM'])
+async def get_pool_stats():
+    """Connection pools of the worker that served the request"""
+    return {**pool_stats(), 'routing': replica_set.stats}
+
+
+@metrics_api.get('/metrics', tags=['SYSTEM'], response_class=PlainTextResponse)
+async def get_metrics():
+    """Prometheus exposition aggregated over every worker"""
+    return PlainTextResponse(await metrics.render(), media_type='text/plain; version=0.0.4')
@@ -3,12 +3,30 @@ import os
 
 load_dotenv()
 
+DEBUG: bool = os.getenv('DEBUG', 'false').lower() == 'true'
+
 # Database
 POSTGRES_DB: str = os.getenv('POSTGRES_DB')
 POSTGRES_HOST: str = os.getenv('POSTGRES_HOST')
 POSTGRES_PORT: int = int(os.getenv('POSTGRES_PORT'))
 POSTGRES_USER: str = os.getenv('POSTGRES_USER')
 POSTGRES_PASSWORD: str = os.getenv('POSTGRES_PASSWORD')
+POSTGRES_REPLICA_HOSTS = [host.strip() for host in os.getenv('POSTGRES_REPLICA_HOSTS', '').split(',') if host.strip()]
+DB_REPLICA_STRATEGY: str = os.getenv('DB_REPLICA_STRATEGY') or 'round_robin'
+DB_REPLICA_MAX_LAG_SECONDS: float = float(os.getenv('DB_REPLICA_MAX_LAG_SECONDS', 5))
+DB_REPLICA_CHECK_INTERVAL_SECONDS: float = float(os.getenv('DB_REPLICA_CHECK_INTERVAL_SECONDS', 2))
+DB_POOL_SIZE: int = int(os.getenv('DB_POOL_SIZE', 10))
+DB_MAX_OVERFLOW: int = int(os.getenv('DB_MAX_OVERFLOW', 10))
+DB_POOL_TIMEOUT: float = float(os.getenv('DB_POOL_TIMEOUT', 10))
+DB_POOL_RECYCLE: int = int(os.getenv('DB_POOL_RECYCLE', 1800))
+DB_POOL_PRE_PING: bool = os.getenv('DB_POOL_PRE_PING', 'true').lower() == 'true'
+DB_POOL_PREWARM: int = int(os.getenv('DB_POOL_PREWARM', 5))
+# asyncpg prepared statement cache per connection, 0 behind pgbouncer in transaction mode
+DB_STATEMENT_CACHE_SIZE: int = int(os.getenv('DB_STATEMENT_CACHE_SIZE', 100))
+SQL_SLOW_QUERY_SECONDS: float = float(os.getenv('SQL_SLOW_QUERY_SECONDS', 0.5))
+SQL_EXPLAIN_SLOW_QUERIES: bool = os.getenv('SQL_EXPLAIN_SLOW_QUERIES', 'false').lower() == 'true'
+SQL_N_PLUS_ONE_THRESHOLD: int = int(os.getenv('SQL_N_PLUS_ONE_THRESHOLD', 5))
+SQL_SLOWEST_KEPT: int = int(os.getenv('SQL_SLOWEST_KEPT', 3))
 
 # Auth
 SECRET_KEY: str = os.getenv('SECRET_KEY')
@@ -16,12 +34,34 @@ ACCESS_TOKEN_TTL_MINUTES: int = 180
 REFRESH_TOKEN_TTL_DAYS: int = 60
 MESSAGE_TOKEN_TTL_SECONDS: int = 120
 ALGORITHM: str = os.getenv('ALGORITHM')
+HASHER_MAX_WORKERS: int = int(os.getenv('HASHER_MAX_WORKERS', 2))
+HASHER_MAX_QUEUE: int = int(os.getenv('HASHER_MAX_QUEUE', 64))
 
 # S3 Storage
 AWS_ACCESS_KEY_ID = os.getenv('AWS_ACCESS_KEY_ID')
 AWS_SECRET_ACCESS_KEY = os.getenv('AWS_SECRET_ACCESS_KEY')
 REGION_NAME = os.getenv('REGION_NAME')
 BUCKET_NAME = os.getenv('BUCKET_NAME')
+S3_ENDPOINT_URL = os.getenv('S3_ENDPOINT_URL') or 'https://storage.yandexcloud.net'
+S3_MAX_POOL_CONNECTIONS: int = int(os.getenv('S3_MAX_POOL_CONNECTIONS', 20))
+S3_CONNECT_TIMEOUT: float = float(os.getenv('S3_CONNECT_TIMEOUT', 5))
+S3_READ_TIMEOUT: float = float(os.getenv('S3_READ_TIMEOUT', 60))
+S3_MULTIPART_PART_SIZE: int = int(os.getenv('S3_MULTIPART_PART_SIZE', 8 * 1024 * 1024))
+S3_MULTIPART_CONCURRENCY: int = int(os.getenv('S3_MULTIPART_CONCURRENCY', 4))
+S3_PRESIGNED_URL_TTL_SECONDS: int = int(os.getenv('S3_PRESIGNED_URL_TTL_SECONDS', 300))
+S3_PRESIGNED_URL_MIN_TTL_SECONDS: int = int(os.getenv('S3_PRESIGNED_URL_MIN_TTL_SECONDS', 60))
+S3_PRESIGNED_URL_CACHE_SIZE: int = int(os.getenv('S3_PRESIGNED_URL_CACHE_SIZE', 10000))
+S3_UPLOAD_MAX_SIZE: int = int(os.getenv('S3_UPLOAD_MAX_SIZE', 100 * 1024 * 1024))
+S3_PRESIGNED_POST_TTL_SECONDS: int = int(os.getenv('S3_PRESIGNED_POST_TTL_SECONDS', 600))
+S3_UPLOAD_CONTENT_TYPES = [
+    'application/pdf',
+    'application/zip',
+    'image/jpeg',
+    'image/png',
+    'text/plain',
+    'application/msword',
+    'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
+]
 
 # Redis
 REDIS_HOST = os.getenv('REDIS_HOST')
@@ -32,14 +72,41 @@ REDIS_PASSWORD = os.getenv('REDIS_PASSWORD')
 REDIS_MESSAGE_CHANNEL = os.getenv('REDIS_PASSWORD') or 'msg'
 REFRESH_SESSION_KEY = os.getenv('REFRESH_SESSION_KEY') or 'refresh_session'
 MESSAGE_TOKEN_KEY = os.getenv('MESSAGE_TOKEN_KEY') or 'message_token'
+SERVICE_CACHE_KEY = os.getenv('SERVICE_CACHE_KEY') or 'service_cache'
+SERVICE_CACHE_CHANNEL = os.getenv('SERVICE_CACHE_CHANNEL') or 'service_cache_invalidate'
+SERVICE_CACHE_L1_SIZE: int = int(os.getenv('SERVICE_CACHE_L1_SIZE', 1024))
+CATALOG_VERSION_KEY = os.getenv('CATALOG_VERSION_KEY') or 'catalog_version'
+CATEGORY_CACHE_TTL_SECONDS: int = int(os.getenv('CATEGORY_CACHE_TTL_SECONDS', 3600))
+OFFER_TYPE_CACHE_TTL_SECONDS: int = int(os.getenv('OFFER_TYPE_CACHE_TTL_SECONDS', 3600))
+OFFER_PUBLIC_CACHE_KEY = os.getenv('OFFER_PUBLIC_CACHE_KEY') or 'offer_public'
+OFFER_PUBLIC_CACHE_TTL_SECONDS: int = int(os.getenv('OFFER_PUBLIC_CACHE_TTL_SECONDS', 60))
+OFFER_PUBLIC_CACHE_TOMBSTONE_SECONDS: int = int(os.getenv('OFFER_PUBLIC_CACHE_TOMBSTONE_SECONDS', 10))
+NOTIFICATION_STREAM_KEY = os.getenv('NOTIFICATION_STREAM_KEY') or 'notifications'
+NOTIFICATION_STREAM_MAXLEN: int = int(os.getenv('NOTIFICATION_STREAM_MAXLEN', 1000))
+NOTIFICATION_STREAM_TTL_SECONDS: int = int(os.getenv('NOTIFICATION_STREAM_TTL_SECONDS', 7 * 24 * 60 * 60))
+NOTIFICATION_REPLAY_LIMIT: int = int(os.getenv('NOTIFICATION_REPLAY_LIMIT', 500))
+PUBSUB_QUEUE_SIZE: int = int(os.getenv('PUBSUB_QUEUE_SIZE', 100))
+PUBSUB_READ_TIMEOUT_SECONDS: float = float(os.getenv('PUBSUB_READ_TIMEOUT_SECONDS', 1.0))
+METRICS_KEY = os.getenv('METRICS_KEY') or 'metrics'
+METRICS_FLUSH_INTERVAL_SECONDS: float = float(os.getenv('METRICS_FLUSH_INTERVAL_SECONDS', 5))
 
 SMTP_EMAIL: str = os.getenv('SMTP_EMAIL')
 SMTP_PASSWORD: str = os.getenv('SMTP_PASSWORD')
 SMTP_SERVER: str = os.getenv('SMTP_SERVER')
 SMTP_PORT: int = int(os.getenv('SMTP_PORT'))
+SMTP_USE_SSL: bool = os.getenv('SMTP_USE_SSL', 'true').lower() == 'true'
+SMTP_POOL_SIZE: int = int(os.getenv('SMTP_POOL_SIZE', 2))
+SMTP_POOL_MAX_MESSAGES: int = int(os.getenv('SMTP_POOL_MAX_MESSAGES', 500))
+EMAIL_BATCH_SIZE: int = int(os.getenv('EMAIL_BATCH_SIZE', 50))
 
 ORIGIN = 'http://localhost:8000'
 
+# Pagination
+PAGE_SIZE_DEFAULT: int = int(os.getenv('PAGE_SIZE_DEFAULT', 20))
+PAGE_SIZE_MAX: int = int(os.getenv('PAGE_SIZE_MAX', 100))
+MESSAGE_PAGE_SIZE_DEFAULT: int = int(os.getenv('MESSAGE_PAGE_SIZE_DEFAULT', 50))
+MESSAGE_PAGE_SIZE_MAX: int = int(os.getenv('MESSAGE_PAGE_SIZE_MAX', 100))
+
 FILE_LINKS_DOMAIN = [
     'https://docs.google.com',
     'https://drive.google.com',
@@ -1,21 +1,80 @@
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
-from core.config import POSTGRES_DB, POSTGRES_HOST, POSTGRES_PORT, POSTGRES_USER, POSTGRES_PASSWORD
+from core.config import POSTGRES_DB, POSTGRES_HOST, POSTGRES_PORT, POSTGRES_USER, POSTGRES_PASSWORD, \
+    POSTGRES_REPLICA_HOSTS, DB_REPLICA_STRATEGY, DB_REPLICA_MAX_LAG_SECONDS, DB_POOL_SIZE, DB_MAX_OVERFLOW, \
+    DB_POOL_TIMEOUT, DB_POOL_RECYCLE, DB_POOL_PRE_PING, DB_POOL_PREWARM, DB_STATEMENT_CACHE_SIZE
+from sqlalchemy.ext.asyncio import AsyncEngine
+from core.pool import InstrumentedPool, prewarm
+from core.sql_stats import instrument
+from core.routing import ReplicaSet, RoutingSession
 from sqlalchemy.orm import DeclarativeBase
 from typing import AsyncGenerator
 from sqlalchemy import MetaData
+import asyncio
+import os
 
-DATABASE_URL = f'postgresql+asyncpg://{POSTGRES_USER}:{POSTGRES_PASSWORD}@{POSTGRES_HOST}:{POSTGRES_PORT}/{POSTGRES_DB}'
 
-async_engine = create_async_engine(DATABASE_URL)
-async_session = async_sessionmaker(async_engine, expire_on_commit=False, class_=AsyncSession)
+def database_url(host: str, port) -> str:
+    return f'postgresql+asyncpg://{POSTGRES_USER}:{POSTGRES_PASSWORD}@{host}:{port}/{POSTGRES_DB}'
+
+
+def create_engine(url: str) -> AsyncEngine:
+    engine = create_async_engine(
+        url,
+        poolclass=InstrumentedPool,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=DB_POOL_RECYCLE,
+        pool_pre_ping=DB_POOL_PRE_PING,
+        connect_args={'prepared_statement_cache_size': DB_STATEMENT_CACHE_SIZE},
+    )
+    instrument(engine)
+    return engine
+
+
+def replica_url(host: str) -> str:
+    """`host` or `host:port` from POSTGRES_REPLICA_HOSTS"""
+    name, _, port = host.partition(':')
+    return database_url(name, port or POSTGRES_PORT)
+
+
+DATABASE_URL = database_url(POSTGRES_HOST, POSTGRES_PORT)
+
+async_engine = create_engine(DATABASE_URL)
+replica_set = ReplicaSet(
+    async_engine,
+    [create_engine(replica_url(host)) for host in POSTGRES_REPLICA_HOSTS],
+    strategy=DB_REPLICA_STRATEGY,
+    max_lag=DB_REPLICA_MAX_LAG_SECONDS,
+)
+# Without replicas sessions stay on the plain Session bound to the primary
+async_session = async_sessionmaker(
+    async_engine, expire_on_commit=False, class_=AsyncSession,
+    **({'sync_session_class': RoutingSession, 'replica_set': replica_set} if replica_set.replicas else {})
+)
 
 metadata = MetaData()
 
 
+async def prewarm_pools():
+    count = min(DB_POOL_PREWARM, DB_POOL_SIZE)
+    await asyncio.gather(*(prewarm(engine, count) for engine in [async_engine, *replica_set.replicas]))
+
+
+def pool_stats() -> dict:
+    """Pool state of this worker, every gunicorn worker has its own pools"""
+    return {
+        'pid': os.getpid(),
+        'primary': async_engine.pool.stats,
+        'replicas': {f'{engine.url.host}:{engine.url.port}': engine.pool.stats for engine in replica_set.replicas},
+    }
+
+
 class Base(DeclarativeBase):
     pass
 
 
 async def get_async_session() -> AsyncGenerator[AsyncSession, None]:
+    """Request-scoped session, FastAPI caches it so every service of a request shares it"""
     async with async_session() as session:
         yield session
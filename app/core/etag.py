@@ -0,0 +1,17 @@
+from fastapi import Response
+from typing import Optional
+
+
+def make_etag(*parts) -> str:
+    return '"' + '-'.join(part.__str__() for part in parts) + '"'
+
+
+def is_not_modified(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = [candidate.strip() for candidate in if_none_match.split(',')]
+    return '*' in candidates or etag in [candidate.removeprefix('W/') for candidate in candidates]
+
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers={'ETag': etag})
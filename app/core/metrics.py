@@ -0,0 +1,178 @@
+from core.config import METRICS_KEY, METRICS_FLUSH_INTERVAL_SECONDS
+from typing import Callable, Dict, List, Tuple
+from core.redis import redis_session
+from collections import defaultdict
+from time import perf_counter
+from bisect import bisect_left
+import socket
+import asyncio
+import logging
+import json
+import os
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+UNMATCHED_ROUTE = 'unmatched'
+
+
+class Metrics:
+    """Per-worker request metrics, flushed as deltas into Redis so `/metrics` sees every worker.
+
+    Counters and histograms are summed with HINCRBYFLOAT into one hash. Gauges (in-flight
+    requests and the registered component stats) are snapshots, each worker writes its own
+    key with a TTL so stopped workers drop out.
+    """
+    def __init__(self, key: str = METRICS_KEY, flush_interval: float = METRICS_FLUSH_INTERVAL_SECONDS):
+        self.key: str = key
+        self.flush_interval: float = flush_interval
+        self.worker: str = f'{socket.gethostname()}:{os.getpid()}'
+        self.in_flight: int = 0
+        self.collectors: Dict[str, Callable[[], dict]] = {}
+        self.redis = redis_session()
+        self.__requests: Dict[Tuple[str, str, int], int] = defaultdict(int)
+        # (method, route) -> [count per bucket..., count over the last bucket, sum of seconds]
+        self.__latency: Dict[Tuple[str, str], List[float]] = {}
+
+    def observe(self, method: str, route: str, status: int, seconds: float):
+        self.__requests[(method, route, status)] += 1
+        latency = self.__latency.get((method, route))
+        if latency is None:
+            latency = self.__latency[(method, route)] = [0] * (len(LATENCY_BUCKETS) + 2)
+        latency[bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        latency[-1] += seconds
+
+    def register(self, component: str, collector: Callable[[], dict]):
+        self.collectors[component] = collector
+
+    def snapshot(self) -> dict:
+        components = {}
+        for component, collector in self.collectors.items():
+            try:
+                components[component] = collector()
+            except Exception as e:
+                logger.warning('Metrics collector %s failed: %s', component, e)
+        return {'in_flight': self.in_flight, 'components': components}
+
+    async def flush(self):
+        requests, self.__requests = self.__requests, defaultdict(int)
+        latency, self.__latency = self.__latency, {}
+        worker_key = f'{self.key}:worker:{self.worker}'
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for (method, route, status), count in requests.items():
+                pipe.hincrbyfloat(self.key, f'requests|{method}|{route}|{status}', count)
+            for (method, route), values in latency.items():
+                for i, count in enumerate(values[:-1]):
+                    if count:
+                        pipe.hincrbyfloat(self.key, f'bucket|{method}|{route}|{i}', count)
+                pipe.hincrbyfloat(self.key, f'sum|{method}|{route}', values[-1])
+            pipe.setex(worker_key, int(self.flush_interval * 3) + 1, json.dumps(self.snapshot(), default=str))
+            pipe.sadd(f'{self.key}:workers', self.worker)
+            await pipe.execute()
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.warning('Metrics flush failed: %s', e)
+
+    async def render(self) -> str:
+        """Prometheus text exposition of every worker"""
+        await self.flush()
+        totals = await self.redis.hgetall(self.key)
+        workers = sorted(
+            worker.decode() if isinstance(worker, bytes) else worker
+            for worker in await self.redis.smembers(f'{self.key}:workers')
+        )
+        snapshots = await self.redis.mget([f'{self.key}:worker:{worker}' for worker in workers]) if workers else []
+        gone = [worker for worker, snapshot in zip(workers, snapshots) if snapshot is None]
+        if gone:
+            await self.redis.srem(f'{self.key}:workers', *gone)
+
+        requests, buckets, sums = [], defaultdict(lambda: [0.0] * (len(LATENCY_BUCKETS) + 1)), {}
+        for field, value in totals.items():
+            kind, *labels = (field.decode() if isinstance(field, bytes) else field).split('|')
+            value = float(value)
+            if kind == 'requests':
+                requests.append((labels, value))
+            elif kind == 'bucket':
+                buckets[(labels[0], labels[1])][int(labels[2])] += value
+            elif kind == 'sum':
+                sums[(labels[0], labels[1])] = value
+
+        lines = ['# HELP http_requests_total Requests by route template and status',
+                 '# TYPE http_requests_total counter']
+        for (method, route, status), value in sorted(requests):
+            lines.append(f'http_requests_total{{method="{method}",route="{route}",status="{status}"}} {value:g}')
+        lines += ['# HELP http_request_duration_seconds Request latency by route template',
+                  '# TYPE http_request_duration_seconds histogram']
+        for (method, route), counts in sorted(buckets.items()):
+            labels = f'method="{method}",route="{route}"'
+            cumulative = 0.0
+            for bound, count in zip((*LATENCY_BUCKETS, '+Inf'), counts):
+                cumulative += count
+                lines.append(f'http_request_duration_seconds_bucket{{{labels},le="{bound}"}} {cumulative:g}')
+            lines.append(f'http_request_duration_seconds_sum{{{labels}}} {sums.get((method, route), 0.0)}')
+            lines.append(f'http_request_duration_seconds_count{{{labels}}} {cumulative:g}')
+        lines += ['# HELP http_requests_in_flight Requests being served by the worker',
+                  '# TYPE http_requests_in_flight gauge']
+        stats = []
+        for worker, snapshot in zip(workers, snapshots):
+            if snapshot is None:
+                continue
+            snapshot = json.loads(snapshot)
+            lines.append(f'http_requests_in_flight{{worker="{worker}"}} {snapshot["in_flight"]}')
+            for component, values in snapshot['components'].items():
+                stats += [(worker, component, name, value) for name, value in flatten(values)]
+        lines += ['# HELP app_component_stat Internal pool, cache and queue statistics',
+                  '# TYPE app_component_stat gauge']
+        for worker, component, name, value in stats:
+            lines.append(f'app_component_stat{{worker="{worker}",component="{component}",stat="{name}"}} {value:g}')
+        return '\n'.join(lines) + '\n'
+
+
+def flatten(values: dict, prefix: str = ''):
+    """Numeric leaves of nested stats as (dotted.name, value)"""
+    for name, value in values.items():
+        name = f'{prefix}{name}'
+        if isinstance(value, dict):
+            yield from flatten(value, f'{name}.')
+        elif isinstance(value, (int, float)):
+            yield name, float(value)
+
+
+class MetricsMiddleware:
+    """Pure ASGI middleware, records every HTTP request under its route template.
+
+    The router stores the matched route in the scope, so the label is the template
+    (`/api/v1/offer/public/{offer_id}`), never the raw path.
+    """
+    def __init__(self, app, metrics: Metrics):
+        self.app = app
+        self.metrics: Metrics = metrics
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+            await send(message)
+
+        metrics = self.metrics
+        metrics.in_flight += 1
+        started = perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            metrics.in_flight -= 1
+            route = scope.get('route')
+            metrics.observe(scope['method'], route.path if route else UNMATCHED_ROUTE, status, perf_counter() - started)
+
+
+metrics = Metrics()
@@ -0,0 +1,61 @@
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from sqlalchemy.exc import TimeoutError
+from time import perf_counter
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class InstrumentedPool(AsyncAdaptedQueuePool):
+    """`AsyncAdaptedQueuePool` that records how long checkouts wait for a connection.
+
+    The wait includes opening a new connection when the pool grows, which is exactly
+    what a request pays for on a cold or exhausted pool.
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.__checkouts: int = 0
+        self.__timeouts: int = 0
+        self.__wait_seconds: float = 0.0
+        self.__wait_max: float = 0.0
+
+    def _do_get(self):
+        started = perf_counter()
+        try:
+            return super()._do_get()
+        except TimeoutError:
+            self.__timeouts += 1
+            raise
+        finally:
+            waited = perf_counter() - started
+            self.__checkouts += 1
+            self.__wait_seconds += waited
+            self.__wait_max = max(self.__wait_max, waited)
+
+    @property
+    def stats(self) -> dict:
+        return {
+            'size': self.size(),
+            'checked_out': self.checkedout(),
+            'idle': self.checkedin(),
+            'overflow': max(self.overflow(), 0),
+            'max_overflow': self._max_overflow,
+            'checkouts': self.__checkouts,
+            'timeouts': self.__timeouts,
+            'wait_seconds_total': self.__wait_seconds,
+            'wait_seconds_max': self.__wait_max,
+        }
+
+
+async def prewarm(engine: AsyncEngine, count: int):
+    """Opens `count` connections at once and hands them back to the pool"""
+    connections = await asyncio.gather(*(engine.connect().start() for _ in range(count)), return_exceptions=True)
+    failed = [connection for connection in connections if isinstance(connection, BaseException)]
+    for connection in connections:
+        if not isinstance(connection, BaseException):
+            await connection.close()
+    if failed:
+        logger.warning('Pre-warmed %d of %d connections to %s: %s',
+                       count - len(failed), count, engine.url.host, failed[0])
@@ -0,0 +1,145 @@
+from core.config import PUBSUB_QUEUE_SIZE, PUBSUB_READ_TIMEOUT_SECONDS
+from typing import Dict, Optional, Set
+from core.redis import redis_session
+from time import perf_counter
+import aioredis
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class Subscription:
+    """Per-client queue fed by `PubSubHub`.
+
+    The oldest message is dropped when it is full, the consumer learns about it from
+    `take_overflow` and has to recover the gap itself.
+    """
+    def __init__(self, hub: 'PubSubHub', channel: str, maxsize: int):
+        self.channel: str = channel
+        self.dropped: int = 0
+        self.__hub: 'PubSubHub' = hub
+        self.__queue: asyncio.Queue = asyncio.Queue(maxsize)
+        self.__overflowed: bool = False
+
+    def put(self, data: str, received_at: float):
+        if self.__queue.full():
+            self.__queue.get_nowait()
+            self.dropped += 1
+            self.__overflowed = True
+        self.__queue.put_nowait((received_at, data))
+
+    def take_overflow(self) -> bool:
+        """True once after messages were dropped since the previous call"""
+        overflowed, self.__overflowed = self.__overflowed, False
+        return overflowed
+
+    async def get(self) -> str:
+        received_at, data = await self.__queue.get()
+        self.__hub.record_dispatch(perf_counter() - received_at)
+        return data
+
+    @property
+    def depth(self) -> int:
+        return self.__queue.qsize()
+
+
+class PubSubHub:
+    """One Redis pub/sub connection per worker shared by every subscriber.
+
+    Channels are subscribed on the first `subscribe` and unsubscribed after the last
+    `unsubscribe`. A single reader task fans incoming messages out to the subscribers'
+    queues, so clients wait on their queue instead of polling Redis.
+    """
+    def __init__(self, redis: aioredis.Redis, queue_size: int, read_timeout: float):
+        self.queue_size: int = queue_size
+        self.read_timeout: float = read_timeout
+        self.__redis: aioredis.Redis = redis
+        self.__pubsub = None
+        self.__channels: Dict[str, Set[Subscription]] = {}
+        self.__reader: Optional[asyncio.Task] = None
+        self.__received: int = 0
+        self.__dispatched: int = 0
+        self.__latency_total: float = 0.0
+        self.__latency_max: float = 0.0
+
+    def use_redis(self, redis: aioredis.Redis):
+        """Swaps the Redis client before anything subscribed, for in-process stand-ins"""
+        if self.__channels:
+            raise RuntimeError('Cannot swap Redis with active subscriptions')
+        self.__redis = redis
+        self.__pubsub = None
+
+    async def subscribe(self, channel: str) -> Subscription:
+        if self.__pubsub is None:
+            self.__pubsub = self.__redis.pubsub(ignore_subscribe_messages=True)
+        subscription = Subscription(self, channel, self.queue_size)
+        subscribers = self.__channels.setdefault(channel, set())
+        subscribers.add(subscription)
+        if len(subscribers) == 1:
+            await self.__pubsub.subscribe(channel)
+        if self.__reader is None or self.__reader.done():
+            self.__reader = asyncio.create_task(self.__read())
+        return subscription
+
+    async def unsubscribe(self, subscription: Subscription):
+        subscribers = self.__channels.get(subscription.channel)
+        if not subscribers:
+            return
+        subscribers.discard(subscription)
+        if not subscribers:
+            del self.__channels[subscription.channel]
+            await self.__pubsub.unsubscribe(subscription.channel)
+
+    async def close(self):
+        if self.__reader is not None:
+            self.__reader.cancel()
+        if self.__pubsub is not None:
+            await self.__pubsub.close()
+        self.__channels.clear()
+
+    def record_dispatch(self, latency: float):
+        self.__dispatched += 1
+        self.__latency_total += latency
+        self.__latency_max = max(self.__latency_max, latency)
+
+    async def __read(self):
+        while self.__channels:
+            try:
+                message = await self.__pubsub.get_message(
+                    ignore_subscribe_messages=True, timeout=self.read_timeout
+                )
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning('Redis pub/sub read failed: %s', e)
+                await asyncio.sleep(self.read_timeout)
+                continue
+            if message is None or message.get('type') != 'message':
+                continue
+            received_at = perf_counter()
+            self.__received += 1
+            channel = message['channel']
+            data = message['data']
+            channel = channel.decode() if isinstance(channel, bytes) else channel
+            data = data.decode() if isinstance(data, bytes) else data
+            for subscription in tuple(self.__channels.get(channel, ())):
+                subscription.put(data, received_at)
+
+    @property
+    def stats(self) -> dict:
+        depths = [s.depth for subscribers in self.__channels.values() for s in subscribers]
+        return {
+            'channels': len(self.__channels),
+            'subscriptions': len(depths),
+            'queue_depth_total': sum(depths),
+            'queue_depth_max': max(depths, default=0),
+            'received': self.__received,
+            'dispatched': self.__dispatched,
+            'dropped': sum(s.dropped for subscribers in self.__channels.values() for s in subscribers),
+            'dispatch_latency_seconds_total': self.__latency_total,
+            'dispatch_latency_seconds_max': self.__latency_max,
+        }
+
+
+pubsub_hub = PubSubHub(redis_session(), queue_size=PUBSUB_QUEUE_SIZE, read_timeout=PUBSUB_READ_TIMEOUT_SECONDS)
@@ -0,0 +1,107 @@
+from sqlalchemy.ext.asyncio import AsyncEngine
+from typing import Dict, List, Optional
+from sqlalchemy.orm import Session
+from sqlalchemy.sql import Select
+from sqlalchemy import text
+from itertools import count
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+USE_PRIMARY = 'use_primary'
+REPLICA = 'replica'
+
+# 0 when everything received is replayed, otherwise time since the last replayed transaction
+REPLICA_LAG_QUERY = text(
+    'SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 '
+    'ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END'
+)
+
+
+class ReplicaSet:
+    """Read replicas of the primary, only replicas lagging at most `max_lag` seconds are handed out.
+
+    Health is refreshed by `monitor`, until the first `check` every read goes to the primary.
+    """
+    STRATEGIES = ('round_robin', 'least_busy')
+
+    def __init__(self, primary: AsyncEngine, replicas: List[AsyncEngine], strategy: str = 'round_robin',
+                 max_lag: float = 5.0):
+        if strategy not in self.STRATEGIES:
+            raise ValueError(f'Replica strategy must be one of {", ".join(self.STRATEGIES)}')
+        self.primary: AsyncEngine = primary
+        self.replicas: List[AsyncEngine] = replicas
+        self.strategy: str = strategy
+        self.max_lag: float = max_lag
+        self.healthy: List[AsyncEngine] = []
+        self.lag: Dict[str, Optional[float]] = {}
+        self.routed: Dict[str, int] = {'primary': 0, 'replica': 0}
+        self.__counter = count()
+
+    def choose(self) -> AsyncEngine:
+        healthy = self.healthy
+        if not healthy:
+            self.routed['primary'] += 1
+            return self.primary
+        self.routed['replica'] += 1
+        if self.strategy == 'least_busy':
+            return min(healthy, key=lambda engine: engine.sync_engine.pool.checkedout())
+        return healthy[next(self.__counter) % len(healthy)]
+
+    async def check(self, timeout: float = 2.0):
+        healthy = []
+        for engine in self.replicas:
+            name = f'{engine.url.host}:{engine.url.port}'
+            try:
+                async with engine.connect() as connection:
+                    lag = await asyncio.wait_for(connection.scalar(REPLICA_LAG_QUERY), timeout)
+            except Exception as e:
+                logger.warning('Replica %s is unavailable: %s', name, e)
+                lag = None
+            self.lag[name] = None if lag is None else float(lag)
+            if lag is not None and lag <= self.max_lag:
+                healthy.append(engine)
+        if len(healthy) < len(self.healthy):
+            logger.warning('%d of %d replicas are healthy', len(healthy), len(self.replicas))
+        self.healthy = healthy
+
+    async def monitor(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            await self.check(timeout=interval)
+
+    async def dispose(self):
+        for engine in self.replicas:
+            await engine.dispose()
+
+    @property
+    def stats(self) -> dict:
+        return {
+            'replicas': len(self.replicas),
+            'healthy': len(self.healthy),
+            'lag_seconds': dict(self.lag),
+            'routed': dict(self.routed),
+        }
+
+
+class RoutingSession(Session):
+    """Sends flushes, DML and locking reads to the primary and plain reads to a replica.
+
+    After the first write the session sticks to the primary, so a request reads its own
+    writes. The replica is picked once per session, a request holds at most one replica
+    connection.
+    """
+    def __init__(self, *args, replica_set: ReplicaSet, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.replica_set: ReplicaSet = replica_set
+
+    def get_bind(self, mapper=None, clause=None, **kwargs):
+        if self.info.get(USE_PRIMARY):
+            return self.replica_set.primary.sync_engine
+        if self._flushing or not isinstance(clause, Select) or clause._for_update_arg is not None:
+            self.info[USE_PRIMARY] = True
+            return self.replica_set.primary.sync_engine
+        if REPLICA not in self.info:
+            self.info[REPLICA] = self.replica_set.choose()
+        return self.info[REPLICA].sync_engine
@@ -0,0 +1,126 @@
+from core.config import DEBUG, SQL_SLOW_QUERY_SECONDS, SQL_EXPLAIN_SLOW_QUERIES, SQL_N_PLUS_ONE_THRESHOLD, \
+    SQL_SLOWEST_KEPT
+from sqlalchemy.ext.asyncio import AsyncEngine
+from typing import Dict, List, Optional, Tuple
+from contextvars import ContextVar
+from collections import Counter
+from sqlalchemy import event
+from time import perf_counter
+import logging
+import heapq
+
+logger = logging.getLogger(__name__)
+
+
+class QueryStats:
+    """Statements executed while serving one request"""
+    def __init__(self):
+        self.count: int = 0
+        self.seconds: float = 0.0
+        self.statements: Counter = Counter()
+        self.slowest: List[Tuple[float, str]] = []
+
+    def record(self, statement: str, seconds: float):
+        self.count += 1
+        self.seconds += seconds
+        self.statements[statement] += 1
+        if len(self.slowest) < SQL_SLOWEST_KEPT:
+            heapq.heappush(self.slowest, (seconds, statement))
+        elif seconds > self.slowest[0][0]:
+            heapq.heapreplace(self.slowest, (seconds, statement))
+
+    @property
+    def n_plus_one(self) -> Dict[str, int]:
+        """Identical statements repeated often enough to be a loop of lazy loads"""
+        return {statement: count for statement, count in self.statements.items() if count >= SQL_N_PLUS_ONE_THRESHOLD}
+
+
+query_stats: ContextVar[Optional[QueryStats]] = ContextVar('query_stats', default=None)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    # Kept on the execution context, a failed statement never fires after_cursor_execute
+    context._query_started = perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    seconds = perf_counter() - context._query_started
+    stats = query_stats.get()
+    if stats is not None:
+        stats.record(statement, seconds)
+    if seconds >= SQL_SLOW_QUERY_SECONDS:
+        plan = explain(conn, statement, parameters) if SQL_EXPLAIN_SLOW_QUERIES and not executemany else None
+        logger.warning('Slow query %.1f ms: %s', seconds * 1000, statement,
+                       extra={'db_seconds': seconds, 'statement': statement, 'plan': plan})
+
+
+def explain(conn, statement: str, parameters) -> Optional[str]:
+    """EXPLAIN ANALYZE of a slow SELECT on a new raw cursor of the same connection.
+
+    Only SELECTs are re-run, ANALYZE executes the statement. A savepoint keeps a failing
+    EXPLAIN from aborting the request's transaction.
+    """
+    if not statement.lstrip().upper().startswith('SELECT'):
+        return None
+    cursor = conn.connection.cursor()
+    try:
+        cursor.execute('SAVEPOINT explain_slow_query')
+        try:
+            cursor.execute(f'EXPLAIN (ANALYZE, BUFFERS) {statement}', parameters)
+            return '\n'.join(row[0] for row in cursor.fetchall())
+        finally:
+            cursor.execute('ROLLBACK TO SAVEPOINT explain_slow_query')
+    except Exception as e:
+        logger.warning('EXPLAIN of slow query failed: %s', e)
+        return None
+    finally:
+        cursor.close()
+
+
+def instrument(engine: AsyncEngine):
+    event.listen(engine.sync_engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(engine.sync_engine, 'after_cursor_execute', _after_cursor_execute)
+
+
+class QueryStatsMiddleware:
+    """Collects `QueryStats` for every HTTP request and reports N+1 suspects.
+
+    With DEBUG the numbers are also sent as `X-DB-*` response headers and logged per request.
+    """
+    def __init__(self, app, debug: bool = DEBUG):
+        self.app = app
+        self.debug: bool = debug
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+        stats = QueryStats()
+        token = query_stats.set(stats)
+
+        async def send_with_headers(message):
+            if message['type'] == 'http.response.start':
+                message['headers'] = [
+                    *message.get('headers', []),
+                    (b'x-db-query-count', str(stats.count).encode()),
+                    (b'x-db-time-ms', f'{stats.seconds * 1000:.1f}'.encode()),
+                    (b'x-db-n-plus-one', str(len(stats.n_plus_one)).encode()),
+                ]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_headers if self.debug else send)
+        finally:
+            query_stats.reset(token)
+            route = scope.get('route')
+            path = route.path if route else scope['path']
+            for statement, count in stats.n_plus_one.items():
+                logger.warning('N+1 suspect in %s %s: %d x %s', scope['method'], path, count, statement,
+                               extra={'route': path, 'repeats': count, 'statement': statement})
+            if self.debug:
+                logger.info('%s %s: %d queries, %.1f ms', scope['method'], path, stats.count, stats.seconds * 1000,
+                            extra={
+                                'route': path,
+                                'db_queries': stats.count,
+                                'db_seconds': stats.seconds,
+                                'db_slowest': sorted(stats.slowest, reverse=True),
+                            })
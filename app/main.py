@@ -1,14 +1,54 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from contextlib import asynccontextmanager
+from repositories.s3_service import S3Service
+from repositories.cache import listen_invalidations
+from core.config import DB_REPLICA_CHECK_INTERVAL_SECONDS
+from core.database import replica_set, prewarm_pools, pool_stats
+from core.pubsub import pubsub_hub
 from auth.api import auth
 from offer.api import offers_api
 from chat.api import chat_api
+from core.api import system_api, metrics_api
+from core.metrics import metrics, MetricsMiddleware
+from core.sql_stats import QueryStatsMiddleware
+from auth.hasher import hasher_pool
+from repositories.cache import ServiceCache
+from offer.cache import OfferPublicCache
+import asyncio
 
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(_app: FastAPI):
+    await S3Service.start()
+    await replica_set.check()
+    await prewarm_pools()
+    replica_monitor = asyncio.create_task(replica_set.monitor(DB_REPLICA_CHECK_INTERVAL_SECONDS))
+    cache_listener = asyncio.create_task(listen_invalidations(pubsub_hub))
+    metrics_flusher = asyncio.create_task(metrics.run())
+    yield
+    metrics_flusher.cancel()
+    cache_listener.cancel()
+    replica_monitor.cancel()
+    await replica_set.dispose()
+    await pubsub_hub.close()
+    await S3Service.close()
+
+
+app = FastAPI(lifespan=lifespan)
 app.include_router(auth)
 app.include_router(offers_api)
 app.include_router(chat_api)
+app.include_router(system_api)
+app.include_router(metrics_api)
+
+metrics.register('hasher', lambda: hasher_pool.stats)
+metrics.register('pubsub', lambda: pubsub_hub.stats)
+metrics.register('s3', S3Service.stats)
+metrics.register('offer_public_cache', OfferPublicCache.stats)
+metrics.register('service_cache', lambda: {name: cache.stats for name, cache in ServiceCache.registry.items()})
+metrics.register('db_pool', pool_stats)
+metrics.register('db_routing', lambda: replica_set.stats)
 
 app.add_middleware(
     CORSMiddleware,
@@ -17,3 +57,6 @@ app.add_middleware(
     allow_methods=['*'],
     allow_headers=['*']
 )
+app.add_middleware(QueryStatsMiddleware)
+# Added last so it is the outermost middleware and times CORS handling too
+app.add_middleware(MetricsMiddleware, metrics=metrics)
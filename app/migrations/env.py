@@ -7,7 +7,7 @@ from sqlalchemy import pool
 from alembic import context
 import asyncio
 from auth.models import User, PersonalData, PasswordUpdate, UserVerifyInfo
-from offer.models import Category, Offer, OfferType, FileOffer
+from offer.models import Category, Offer, OfferType, FileOffer, Executor
 from chat.models import Message, Chat
 
 # this is the Alembic Config object, which provides
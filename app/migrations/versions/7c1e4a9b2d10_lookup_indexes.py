@@ -0,0 +1,56 @@
+"""lookup indexes
+
+Revision ID: 7c1e4a9b2d10
+Revises: 503cc0d580f8
+Create Date: 2026-10-18 10:12:41.318204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7c1e4a9b2d10'
+down_revision = '503cc0d580f8'
+branch_labels = None
+depends_on = None
+
+# CREATE INDEX CONCURRENTLY can't run inside a transaction block, so every index
+# is built in an autocommit block. If a build fails it leaves an INVALID index
+# behind, drop it with DROP INDEX CONCURRENTLY before running the upgrade again.
+INDEXES = [
+    # /offers/main without filters
+    ('ix_offers_created_at', 'offers', [sa.text('created_at DESC'), sa.text('id DESC')], None),
+    # /offers/main?is_closed=false
+    ('ix_offers_open_created_at', 'offers', [sa.text('created_at DESC'), sa.text('id DESC')],
+     sa.text('is_closed = false')),
+    # /offers/main?is_closed=false&type_id=...&category_id=...
+    ('ix_offers_open_type_category_created_at', 'offers',
+     ['type_id', 'category_id', sa.text('created_at DESC'), sa.text('id DESC')], sa.text('is_closed = false')),
+    # /offers/main?is_closed=false&category_id=...
+    ('ix_offers_open_category_created_at', 'offers',
+     ['category_id', sa.text('created_at DESC'), sa.text('id DESC')], sa.text('is_closed = false')),
+    # /offers/profile
+    ('ix_offers_user_created_at', 'offers', ['user_id', sa.text('created_at DESC'), sa.text('id DESC')], None),
+    # /offers/responses
+    ('ix_executors_user_offer', 'executors', ['user_id', 'offer_id'], None),
+    # selectinload(Offer.executors), create_chat, delete_executor
+    ('ix_executors_offer_user', 'executors', ['offer_id', 'user_id'], None),
+    # selectinload(Offer.files)
+    ('ix_offer_files_offer_id', 'offer_files', ['offer_id'], None),
+    ('ix_chats_offer_id', 'chats', ['offer_id'], None),
+    ('ix_chats_executor_id', 'chats', ['executor_id'], None),
+    ('ix_messages_chat_id', 'messages', ['chat_id'], None),
+]
+
+
+def upgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name, table, columns, where in INDEXES:
+            op.create_index(name, table, columns, postgresql_concurrently=True, postgresql_where=where)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name, table, _, _ in reversed(INDEXES):
+            op.drop_index(name, table_name=table, postgresql_concurrently=True)
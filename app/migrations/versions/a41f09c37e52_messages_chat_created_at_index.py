@@ -0,0 +1,29 @@
+"""messages chat created_at index
+
+Revision ID: a41f09c37e52
+Revises: 7c1e4a9b2d10
+Create Date: 2026-10-18 12:03:57.604118
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'a41f09c37e52'
+down_revision = '7c1e4a9b2d10'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # (chat_id, created_at, id) serves the history keyset and covers every chat_id lookup
+    with op.get_context().autocommit_block():
+        op.create_index('ix_messages_chat_created_at', 'messages', ['chat_id', 'created_at', 'id'],
+                        postgresql_concurrently=True)
+        op.drop_index('ix_messages_chat_id', table_name='messages', postgresql_concurrently=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.create_index('ix_messages_chat_id', 'messages', ['chat_id'], postgresql_concurrently=True)
+        op.drop_index('ix_messages_chat_created_at', table_name='messages', postgresql_concurrently=True)
@@ -0,0 +1,54 @@
+"""chat inbox
+
+Revision ID: c5d82e6f1b93
+Revises: a41f09c37e52
+Create Date: 2026-10-18 13:26:10.771452
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c5d82e6f1b93'
+down_revision = 'a41f09c37e52'
+branch_labels = None
+depends_on = None
+
+READ_AT_BACKFILL_BATCH = 5000
+
+
+def upgrade() -> None:
+    op.add_column('chats', sa.Column('last_message_at', sa.DateTime(),
+                                     server_default=sa.text("timezone('utc', now())"), nullable=False))
+    op.add_column('messages', sa.Column('read_at', sa.DateTime(), nullable=True))
+    op.execute(
+        'UPDATE chats SET last_message_at = COALESCE('
+        '(SELECT max(messages.created_at) FROM messages WHERE messages.chat_id = chats.id), chats.created_at, last_message_at)'
+    )
+    with op.get_context().autocommit_block():
+        # Existing history counts as read, otherwise every old chat would show up as unread.
+        # Walked in primary key batches, each committed on its own, to keep row locks short
+        bind = op.get_bind()
+        last_id = None
+        while True:
+            page = sa.select(sa.column('id')).select_from(sa.table('messages')).order_by('id')
+            if last_id is not None:
+                page = page.where(sa.column('id') > last_id)
+            ids = bind.execute(page.limit(READ_AT_BACKFILL_BATCH)).scalars().all()
+            if not ids:
+                break
+            bind.execute(
+                sa.text('UPDATE messages SET read_at = created_at WHERE id = ANY(:ids) AND read_at IS NULL'),
+                {'ids': ids}
+            )
+            last_id = ids[-1]
+        op.create_index('ix_messages_unread_recipient_chat', 'messages', ['recipient_id', 'chat_id'],
+                        postgresql_concurrently=True, postgresql_where=sa.text('read_at IS NULL'))
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_messages_unread_recipient_chat', table_name='messages', postgresql_concurrently=True)
+    op.drop_column('messages', 'read_at')
+    op.drop_column('chats', 'last_message_at')
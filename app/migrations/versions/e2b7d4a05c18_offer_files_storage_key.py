@@ -0,0 +1,29 @@
+"""offer files storage key
+
+Revision ID: e2b7d4a05c18
+Revises: c5d82e6f1b93
+Create Date: 2026-10-18 14:48:22.190337
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e2b7d4a05c18'
+down_revision = 'c5d82e6f1b93'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('offer_files', sa.Column('storage_key', sa.String(length=255), nullable=True))
+    with op.get_context().autocommit_block():
+        op.create_index('ix_offer_files_storage_key', 'offer_files', ['storage_key'],
+                        unique=True, postgresql_concurrently=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_offer_files_storage_key', table_name='offer_files', postgresql_concurrently=True)
+    op.drop_column('offer_files', 'storage_key')
@@ -0,0 +1,27 @@
+"""offer version
+
+Revision ID: f9a3c17b6e24
+Revises: e2b7d4a05c18
+Create Date: 2026-10-18 16:05:31.442760
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f9a3c17b6e24'
+down_revision = 'e2b7d4a05c18'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Constant server default, Postgres 11+ adds the column without rewriting the table
+    op.add_column('offers', sa.Column('version', sa.Integer(), server_default='1', nullable=False))
+    op.add_column('offers', sa.Column('updated_at', sa.DateTime(), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('offers', 'updated_at')
+    op.drop_column('offers', 'version')
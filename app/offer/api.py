@@ -1,12 +1,22 @@
-from offer.schemas import OfferSchema, OfferUpdate, FileSchema, OfferPublic, OfferPrivate
+from offer.schemas import OfferSchema, OfferUpdate, FileSchema, OfferPublic, OfferPrivate, FileUploadRequest, \
+    FileUploadComplete
 from repositories.dependencies import offer_service, executor_service, file_service, category_service, \
     offer_type_service
-from repositories.services import Service
+from repositories.services import Service, OfferService
+from core.etag import make_etag, is_not_modified, not_modified
 from offer.models import Offer, FileOffer, Executor
 from sqlalchemy.orm import selectinload
+from sqlalchemy.exc import IntegrityError
 from auth.hasher import AuthDependency
-from fastapi import Depends, Response
+from core.config import PAGE_SIZE_DEFAULT, PAGE_SIZE_MAX, S3_UPLOAD_MAX_SIZE, S3_PRESIGNED_POST_TTL_SECONDS
+from repositories.s3_service import S3Service
+from offer.cache import OfferPublicCache
+from fastapi import Depends, Response, Query, Header
+from typing import Annotated, Optional
+from pydantic_core import to_json
+from datetime import datetime
 from fastapi import APIRouter
+from auth.principal import Principal
 from auth.models import User
 
 offers_api = APIRouter(prefix='/api/v1')
@@ -14,33 +24,59 @@ offers_api = APIRouter(prefix='/api/v1')
 
 @offers_api.get('/init_app', tags=['OFFER'])
 async def app_init_route(
+        response: Response,
+        if_none_match: Annotated[str | None, Header()] = None,
         _category_service: Service = Depends(category_service),
         _offer_type_service: Service = Depends(offer_type_service)
 ):
+    etag = make_etag('catalog', await _category_service.cache.version())
+    if is_not_modified(if_none_match, etag):
+        return not_modified(etag)
     categories = await _category_service.select()
     types = await _offer_type_service.select()
+    response.headers['ETag'] = etag
     return {'categories': categories, 'types': types}
 
 
+def page_response(items, next_cursor) -> Response:
+    """Projected rows are plain dicts, pydantic-core encodes them without FastAPI's jsonable_encoder"""
+    return Response(to_json({'items': items, 'next_cursor': next_cursor}), media_type='application/json')
+
+
 @offers_api.post('/offer/create', tags=['OFFER'])
 async def create_offer(
         _offer: OfferSchema,
         _offer_service: Service = Depends(offer_service),
-        user: User = Depends(AuthDependency()),
+        user: Principal = Depends(AuthDependency()),
 ):
     if not user.is_verified:
         return Response('User has to be verified', status_code=400)
-    offer = await _offer_service.add(user_id=user.id, **_offer.model_dump())
+    try:
+        offer = await _offer_service.add(user_id=user.id, **_offer.model_dump())
+    except IntegrityError:
+        await _offer_service.rollback()
+        # Stateless tokens outlive deleted users
+        if not await user.user:
+            return Response('Unauthorized', status_code=401)
+        return Response('Unknown category or type', status_code=400)
+    await _offer_service.commit()
     return offer
 
 
 @offers_api.get('/offer/private/{offer_id}', tags=['OFFER'])
 async def get_private_offer(
         offer_id: str,
-        user: User = Depends(AuthDependency()),
-        _offer_service: Service = Depends(offer_service),
+        if_none_match: Annotated[str | None, Header()] = None,
+        user: Principal = Depends(AuthDependency()),
+        _offer_service: OfferService = Depends(offer_service),
 ):
     """Returns private Offer view"""
+    # Presigned file URLs change with the expiry bucket, so the bucket is part of the ETag
+    url_bucket = S3Service.presigned_url_bucket()
+    if if_none_match:
+        version = await _offer_service.get_version(Offer.id == offer_id, Offer.user_id == user.id)
+        if version is not None and is_not_modified(if_none_match, make_etag('priv', offer_id, version, url_bucket)):
+            return not_modified(make_etag('priv', offer_id, version, url_bucket))
     offer = await _offer_service.get_with_options(
         [
             selectinload(Offer.executors).selectinload(Executor.user).selectinload(User.personal_data),
@@ -52,66 +88,117 @@ async def get_private_offer(
         return Response('Not found', status_code=404)
     if user.id != offer.user_id:
         return Response('Forbidden', status_code=403)
-    return OfferPrivate.offer_private_view(offer)
+    urls = await S3Service.get_presigned_urls(file.storage_key for file in offer.files if file.storage_key)
+    return Response(
+        OfferPrivate.offer_private_view(offer, urls).to_json(),
+        media_type='application/json',
+        headers={'ETag': make_etag('priv', offer.id, offer.version, url_bucket)}
+    )
 
 
 @offers_api.get('/offer/public/{offer_id}', tags=['OFFER'])
 async def get_public_offer(
         offer_id: str,
-        _offer_service: Service = Depends(offer_service),
+        if_none_match: Annotated[str | None, Header()] = None,
+        _offer_service: OfferService = Depends(offer_service),
 ):
     """Returns public Offer view"""
+    cached = await OfferPublicCache.get(offer_id)
+    if cached is not None:
+        etag, payload = cached
+        if is_not_modified(if_none_match, etag):
+            return not_modified(etag)
+        return Response(payload, media_type='application/json', headers={'ETag': etag})
+    url_bucket = S3Service.presigned_url_bucket()
+    if if_none_match:
+        version = await _offer_service.get_version(Offer.id == offer_id)
+        if version is not None and is_not_modified(if_none_match, make_etag('pub', offer_id, version, url_bucket)):
+            return not_modified(make_etag('pub', offer_id, version, url_bucket))
+    # The payload is cached past the invalidation, it must not come from a lagging replica
+    _offer_service.use_primary()
     _offer: Offer = await _offer_service.get_with_options(
         [selectinload(Offer.user).selectinload(User.personal_data), selectinload(Offer.files)],
         Offer.id == offer_id
     )
     if not _offer:
         return Response('Not found', status_code=404)
-    return OfferPublic.offer_public_view(_offer)
+    urls = await S3Service.get_presigned_urls(file.storage_key for file in _offer.files if file.storage_key)
+    payload = OfferPublic.offer_public_view(_offer, urls).model_dump_json()
+    etag = make_etag('pub', _offer.id, _offer.version, url_bucket)
+    await OfferPublicCache.push(_offer.id, _offer.user_id, etag, payload)
+    return Response(payload, media_type='application/json', headers={'ETag': etag})
 
 
 @offers_api.get('/offers/main', tags=['OFFER'])
 async def get_offers(
         type_id: str = None,
         category_id: str = None,
+        is_closed: Optional[bool] = None,
+        cursor: str = None,
+        limit: int = Query(PAGE_SIZE_DEFAULT, ge=1, le=PAGE_SIZE_MAX),
+        fields: str = Query(None, description='Comma separated offer columns, all columns by default'),
         _offer_service: Service = Depends(offer_service)
 ):
+    """All offers by default, `is_closed` narrows the page down to open or closed ones"""
     filters = []
+    if is_closed is not None:
+        # Literal bool (not a bind param) so the planner can match the partial open-offer indexes
+        filters.append(Offer.is_closed == is_closed)
     if type_id:
         filters.append(Offer.type_id == type_id)
     if category_id:
         filters.append(Offer.category_id == category_id)
-    res = await _offer_service.select(*filters)
-    return res
+    try:
+        offers, next_cursor = await _offer_service.select_page(
+            limit, cursor, *filters, columns=_offer_service.projection(fields)
+        )
+    except ValueError as e:
+        return Response(e.__str__(), status_code=400)
+    return page_response(offers, next_cursor)
 
 
 @offers_api.get('/offers/profile', tags=['OFFER'])
 async def get_user_offers(
         _type_id: str = None,
+        cursor: str = None,
+        limit: int = Query(PAGE_SIZE_DEFAULT, ge=1, le=PAGE_SIZE_MAX),
+        fields: str = Query(None, description='Comma separated offer columns, all columns by default'),
         _offer_service: Service = Depends(offer_service),
-        user: User = Depends(AuthDependency())
+        user: Principal = Depends(AuthDependency())
 ):
     # TODO: Возвращает Offers, которые создал USER
-    res = await _offer_service.select(
-        Offer.user_id == user.id, Offer.type_id == _type_id
-    )
-    return res
+    filters = [Offer.user_id == user.id]
+    if _type_id:
+        filters.append(Offer.type_id == _type_id)
+    try:
+        offers, next_cursor = await _offer_service.select_page(
+            limit, cursor, *filters, columns=_offer_service.projection(fields)
+        )
+    except ValueError as e:
+        return Response(e.__str__(), status_code=400)
+    return page_response(offers, next_cursor)
 
 
 @offers_api.get('/offers/responses', tags=['OFFER'])
 async def get_user_response_offers(
         _type_id: str = None,
+        cursor: str = None,
+        limit: int = Query(PAGE_SIZE_DEFAULT, ge=1, le=PAGE_SIZE_MAX),
+        fields: str = Query(None, description='Comma separated offer columns, all columns by default'),
         _offer_service: Service = Depends(offer_service),
-        user: User = Depends(AuthDependency())
+        user: Principal = Depends(AuthDependency())
 ):
     # TODO: "Отклики" User'a
-    res = await _offer_service.select_join(
-        [
-            {'target': Executor, 'onclause': Executor.offer_id == Offer.id}
-        ],
-        Executor.user_id == user.id
-    )
-    return res
+    try:
+        offers, next_cursor = await _offer_service.select_page(
+            limit, cursor,
+            Executor.user_id == user.id,
+            join_models=[{'target': Executor, 'onclause': Executor.offer_id == Offer.id}],
+            columns=_offer_service.projection(fields)
+        )
+    except ValueError as e:
+        return Response(e.__str__(), status_code=400)
+    return page_response(offers, next_cursor)
 
 
 @offers_api.put('/offer/{offer_id}', tags=['OFFER'])
@@ -119,18 +206,23 @@ async def update_offer(
         offer_id: str,
         _offer_schema: OfferUpdate,
         _offer_service: Service = Depends(offer_service),
-        user: User = Depends(AuthDependency())
+        user: Principal = Depends(AuthDependency())
 ):
-    offer = await _offer_service.update(Offer.id == offer_id, Offer.user_id == user.id, **_offer_schema.model_dump())
+    offer = await _offer_service.update(
+        Offer.id == offer_id, Offer.user_id == user.id,
+        version=Offer.version + 1, updated_at=datetime.utcnow(), **_offer_schema.model_dump()
+    )
     if not offer:
         return Response('Not found', status_code=404)
+    await _offer_service.commit()
+    await OfferPublicCache.delete(offer.id)
     return offer
 
 
 @offers_api.delete('/offer/{offer_id}', tags=['OFFER'])
 async def delete_offer(
         offer_id: str,
-        user: User = Depends(AuthDependency()),
+        user: Principal = Depends(AuthDependency()),
         _offer_service: Service = Depends(offer_service)
 ):
     offer = await _offer_service.get(Offer.id == offer_id)
@@ -139,6 +231,8 @@ async def delete_offer(
     if offer.user_id != user.id:
         return Response('Forbidden', status_code=403)
     await _offer_service.delete(offer)
+    await _offer_service.commit()
+    await OfferPublicCache.delete(offer.id)
     return {'id': offer.id, 'status': 'deleted'}
 
 
@@ -146,8 +240,8 @@ async def delete_offer(
 async def create_file(
         offer_id: str,
         _file: FileSchema,
-        user: User = Depends(AuthDependency()),
-        _offer_service: Service = Depends(offer_service),
+        user: Principal = Depends(AuthDependency()),
+        _offer_service: OfferService = Depends(offer_service),
         _file_service: Service = Depends(file_service),
 ):
     offer = await _offer_service.get(Offer.id == offer_id)
@@ -156,6 +250,66 @@ async def create_file(
     if offer.user_id != user.id:
         return Response('Must\'be offer owner', status_code=403)
     file = await _file_service.add(offer_id=offer.id, **_file.model_dump())
+    await _offer_service.bump_version(Offer.id == offer.id)
+    await _file_service.commit()
+    await OfferPublicCache.delete(offer.id)
+    return file
+
+
+@offers_api.post('/offer/{offer_id}/file/upload', tags=['FILE'])
+async def get_file_upload_policy(
+        offer_id: str,
+        _upload: FileUploadRequest,
+        user: Principal = Depends(AuthDependency()),
+        _offer_service: Service = Depends(offer_service),
+):
+    """Presigned POST policy to upload the file straight to storage, then call /file/complete"""
+    offer = await _offer_service.get(Offer.id == offer_id)
+    if not offer:
+        return Response('Not found', status_code=404)
+    if offer.user_id != user.id:
+        return Response('Must\'be offer owner', status_code=403)
+    key_prefix = f'offers/{offer.id}/'
+    key = S3Service.generate_unique_key(key_prefix, _upload.filename)
+    policy = await S3Service.get_presigned_post(
+        key, key_prefix, _upload.content_type, S3_UPLOAD_MAX_SIZE, S3_PRESIGNED_POST_TTL_SECONDS
+    )
+    return {'url': policy['url'], 'fields': policy['fields'], 'key': key, 'expires_in': S3_PRESIGNED_POST_TTL_SECONDS}
+
+
+@offers_api.post('/offer/{offer_id}/file/complete', tags=['FILE'])
+async def complete_file_upload(
+        offer_id: str,
+        _upload: FileUploadComplete,
+        user: Principal = Depends(AuthDependency()),
+        _offer_service: OfferService = Depends(offer_service),
+        _file_service: Service = Depends(file_service),
+):
+    """Registers an object uploaded with the presigned POST policy as an offer file"""
+    offer = await _offer_service.get(Offer.id == offer_id)
+    if not offer:
+        return Response('Not found', status_code=404)
+    if offer.user_id != user.id:
+        return Response('Must\'be offer owner', status_code=403)
+    if not _upload.key.startswith(f'offers/{offer.id}/'):
+        return Response('Key does not belong to offer', status_code=400)
+    head = await S3Service.head_file(_upload.key)
+    if not head:
+        return Response('File is not uploaded', status_code=400)
+    if head.get('ContentLength', 0) > S3_UPLOAD_MAX_SIZE:
+        await S3Service.delete_file(_upload.key)
+        return Response('File is too large', status_code=400)
+    if await _file_service.get(FileOffer.storage_key == _upload.key):
+        return Response('File is already registered', status_code=409)
+    try:
+        file = await _file_service.add(
+            offer_id=offer.id, link=_upload.key, storage_key=_upload.key, description=_upload.description
+        )
+    except IntegrityError:
+        return Response('File is already registered', status_code=409)
+    await _offer_service.bump_version(Offer.id == offer.id)
+    await _file_service.commit()
+    await OfferPublicCache.delete(offer.id)
     return file
 
 
@@ -163,7 +317,8 @@ async def create_file(
 async def update_file(
         file_id: str,
         _file: FileSchema,
-        user: User = Depends(AuthDependency()),
+        user: Principal = Depends(AuthDependency()),
+        _offer_service: OfferService = Depends(offer_service),
         _file_service: Service = Depends(file_service),
 ):
     file: FileOffer = await _file_service.get_with_options([selectinload(FileOffer.offer)], FileOffer.id == file_id)
@@ -173,13 +328,17 @@ async def update_file(
     if offer.user_id != user.id:
         return Response('Forbidden', status_code=403)
     file = await _file_service.update(FileOffer.id == file.id, **_file.model_dump())
+    await _offer_service.bump_version(Offer.id == offer.id)
+    await _file_service.commit()
+    await OfferPublicCache.delete(offer.id)
     return file
 
 
 @offers_api.delete('/file/{file_id}', tags=['FILE'])
 async def delete_file(
         file_id: str,
-        user: User = Depends(AuthDependency()),
+        user: Principal = Depends(AuthDependency()),
+        _offer_service: OfferService = Depends(offer_service),
         _file_service: Service = Depends(file_service),
 ):
     file: FileOffer = await _file_service.get_with_options([selectinload(FileOffer.offer)], FileOffer.id == file_id)
@@ -189,15 +348,21 @@ async def delete_file(
     if offer.user_id != user.id:
         return Response('Forbidden', status_code=403)
     await _file_service.delete(file)
+    await _offer_service.bump_version(Offer.id == offer.id)
+    await _file_service.commit()
+    await OfferPublicCache.delete(offer.id)
+    # Only after commit, so a rolled back delete never loses the object
+    if file.storage_key:
+        await S3Service.delete_file(file.storage_key)
     return {'id': file.id, 'status': 'deleted'}
 
 
 @offers_api.post('/offer/{offer_id}/executor', tags=['EXECUTOR'])
 async def become_executor(
         offer_id: str,
-        user: User = Depends(AuthDependency()),
+        user: Principal = Depends(AuthDependency()),
         _executor_service: Service = Depends(executor_service),
-        _offer_service: Service = Depends(offer_service)
+        _offer_service: OfferService = Depends(offer_service)
 ):
     if not user.is_verified:
         return Response('User has to be verified', status_code=400)
@@ -206,7 +371,13 @@ async def become_executor(
         return Response('Not found', status_code=404)
     if offer.user_id == user.id:
         return Response('Offer\'s owner can\'t be executor of its offer', status_code=400)
-    executor = await _executor_service.add(user_id=user.id, offer_id=offer_id)
+    try:
+        executor = await _executor_service.add(user_id=user.id, offer_id=offer.id)
+    except IntegrityError:
+        # Stateless tokens outlive deleted users, the offer was loaded above
+        return Response('Unauthorized', status_code=401)
+    await _offer_service.bump_version(Offer.id == offer.id)
+    await _executor_service.commit()
     return executor
 
 
@@ -214,8 +385,9 @@ async def become_executor(
 async def delete_executor(
         offer_id: str,
         executor_id: str,
-        user: User = Depends(AuthDependency()),
+        user: Principal = Depends(AuthDependency()),
         _executor_service: Service = Depends(executor_service),
+        _offer_service: OfferService = Depends(offer_service),
 ):
     """User can stop being executor itself + Offer owner can delete executor"""
     executor = await _executor_service.get_with_options(
@@ -228,4 +400,6 @@ async def delete_executor(
     if not (offer.user_id == user.id or executor.user_id == user.id):
         return Response('Forbidden', status_code=403)
     await _executor_service.delete(executor)
+    await _offer_service.bump_version(Offer.id == offer.id)
+    await _executor_service.commit()
     return {'id': executor.id, 'status': 'deleted'}
@@ -0,0 +1,82 @@
+from core.config import OFFER_PUBLIC_CACHE_TTL_SECONDS, OFFER_PUBLIC_CACHE_KEY, S3_PRESIGNED_URL_MIN_TTL_SECONDS
+from core.config import OFFER_PUBLIC_CACHE_TOMBSTONE_SECONDS
+from core.redis import RedisService
+from typing import Optional, Tuple
+
+
+class OfferPublicCache(RedisService):
+    """Serialized `OfferPublic` payloads by offer id.
+
+    Each entry is stored as `<etag>\n<payload>`. Writers call `delete` (or
+    `delete_user_offers` for owner personal data changes) after commit, which also
+    leaves a tombstone for `tombstone_ttl` seconds so a reader that loaded the offer
+    before the commit can't cache its stale view afterwards. The TTL never exceeds the
+    minimum presigned URL lifetime, so cached file URLs are still valid whenever a
+    payload is served.
+    """
+    ttl: int = min(OFFER_PUBLIC_CACHE_TTL_SECONDS, S3_PRESIGNED_URL_MIN_TTL_SECONDS)
+    tombstone_ttl: int = OFFER_PUBLIC_CACHE_TOMBSTONE_SECONDS
+    hits: int = 0
+    misses: int = 0
+
+    @classmethod
+    async def get(cls, offer_id) -> Optional[Tuple[str, str]]:
+        """(etag, payload) or None"""
+        entry = await cls.redis.get(f'{OFFER_PUBLIC_CACHE_KEY}:{offer_id}')
+        if entry is None:
+            cls.misses += 1
+            return None
+        cls.hits += 1
+        etag, payload = (entry.decode() if isinstance(entry, bytes) else entry).split('\n', 1)
+        return etag, payload
+
+    @classmethod
+    async def push(cls, offer_id, user_id, etag: str, payload: str):
+        """Caches the payload unless the offer or its owner was invalidated in the meantime.
+
+        Both this and the writers run in MULTI: either the writer's delete lands after the
+        SETEX, or its tombstone is already visible here and the entry is dropped again.
+        """
+        key = f'{OFFER_PUBLIC_CACHE_KEY}:{offer_id}'
+        user_key = f'{OFFER_PUBLIC_CACHE_KEY}_user:{user_id}'
+        async with cls.redis.pipeline(transaction=True) as pipe:
+            pipe.setex(key, cls.ttl, f'{etag}\n{payload}')
+            pipe.sadd(user_key, str(offer_id))
+            pipe.expire(user_key, cls.ttl)
+            pipe.exists(cls.__tombstone(offer_id), cls.__user_tombstone(user_id))
+            *_, stale = await pipe.execute()
+        if stale:
+            await cls.redis.delete(key)
+
+    @classmethod
+    async def delete(cls, *offer_ids):
+        if offer_ids:
+            async with cls.redis.pipeline(transaction=True) as pipe:
+                pipe.delete(*[f'{OFFER_PUBLIC_CACHE_KEY}:{offer_id}' for offer_id in offer_ids])
+                for offer_id in offer_ids:
+                    pipe.setex(cls.__tombstone(offer_id), cls.tombstone_ttl, 1)
+                await pipe.execute()
+
+    @classmethod
+    async def delete_user_offers(cls, user_id):
+        """Owner's personal data is part of the payload, drop every cached offer of theirs"""
+        user_key = f'{OFFER_PUBLIC_CACHE_KEY}_user:{user_id}'
+        offer_ids = await cls.redis.smembers(user_key)
+        async with cls.redis.pipeline(transaction=True) as pipe:
+            pipe.delete(
+                user_key, *[f'{OFFER_PUBLIC_CACHE_KEY}:{offer_id.decode()}' for offer_id in offer_ids]
+            )
+            pipe.setex(cls.__user_tombstone(user_id), cls.tombstone_ttl, 1)
+            await pipe.execute()
+
+    @staticmethod
+    def __tombstone(offer_id) -> str:
+        return f'{OFFER_PUBLIC_CACHE_KEY}_stale:{offer_id}'
+
+    @staticmethod
+    def __user_tombstone(user_id) -> str:
+        return f'{OFFER_PUBLIC_CACHE_KEY}_user_stale:{user_id}'
+
+    @classmethod
+    def stats(cls) -> dict:
+        return {'hits': cls.hits, 'misses': cls.misses}
@@ -40,6 +40,9 @@ class Offer(Base, AsyncAttrs):
     is_closed: Mapped[bool] = mapped_column(sqlalchemy.Boolean, default=False)
     deadline: Mapped[datetime] = mapped_column(sqlalchemy.DateTime, nullable=True)
     created_at: Mapped[datetime] = mapped_column(sqlalchemy.DateTime, default=datetime.utcnow)
+    # Bumped on every change visible in the offer views (offer, files, executors, people), used for ETags
+    version: Mapped[int] = mapped_column(sqlalchemy.Integer, default=1, server_default='1', nullable=False)
+    updated_at: Mapped[datetime] = mapped_column(sqlalchemy.DateTime, default=datetime.utcnow, nullable=True)
 
     category: Mapped['Category'] = relationship('Category', back_populates='category_offers')
     type: Mapped['OfferType'] = relationship('OfferType', back_populates='type_offers')
@@ -50,6 +53,25 @@ class Offer(Base, AsyncAttrs):
         return f'Offer(id={self.id})'
 
 
+sqlalchemy.Index('ix_offers_created_at', Offer.created_at.desc(), Offer.id.desc())
+sqlalchemy.Index(
+    'ix_offers_open_created_at',
+    Offer.created_at.desc(), Offer.id.desc(),
+    postgresql_where=Offer.is_closed == False,  # noqa: E712
+)
+sqlalchemy.Index(
+    'ix_offers_open_type_category_created_at',
+    Offer.type_id, Offer.category_id, Offer.created_at.desc(), Offer.id.desc(),
+    postgresql_where=Offer.is_closed == False,  # noqa: E712
+)
+sqlalchemy.Index(
+    'ix_offers_open_category_created_at',
+    Offer.category_id, Offer.created_at.desc(), Offer.id.desc(),
+    postgresql_where=Offer.is_closed == False,  # noqa: E712
+)
+sqlalchemy.Index('ix_offers_user_created_at', Offer.user_id, Offer.created_at.desc(), Offer.id.desc())
+
+
 class FileOffer(Base):
     __tablename__ = 'offer_files'
 
@@ -57,9 +79,15 @@ class FileOffer(Base):
     offer_id: Mapped[UUID] = mapped_column(sqlalchemy.ForeignKey('offers.id', ondelete='CASCADE'))
     link: Mapped[str] = mapped_column(sqlalchemy.String(150), nullable=False)
     description: Mapped[str] = mapped_column(sqlalchemy.String(255), nullable=True)
+    storage_key: Mapped[str] = mapped_column(sqlalchemy.String(255), nullable=True)
 
     offer: Mapped['Offer'] = relationship('Offer', backref='files')
 
+    __table_args__ = (
+        sqlalchemy.Index('ix_offer_files_offer_id', 'offer_id'),
+        sqlalchemy.Index('ix_offer_files_storage_key', 'storage_key', unique=True),
+    )
+
 
 class Executor(Base):
     __tablename__ = 'executors'
@@ -71,3 +99,8 @@ class Executor(Base):
 
     user: Mapped['User'] = relationship('User', back_populates='offer_executor')
     offer: Mapped['Offer'] = relationship('Offer', back_populates='executors')
+
+    __table_args__ = (
+        sqlalchemy.Index('ix_executors_user_offer', 'user_id', 'offer_id'),
+        sqlalchemy.Index('ix_executors_offer_user', 'offer_id', 'user_id'),
+    )
@@ -3,7 +3,14 @@ from datetime import datetime
 from typing import Optional, List
 from auth.schemas import UserRead, PersonalDataSchema
 from uuid import UUID
-from core.config import FILE_LINKS_DOMAIN
+from core.config import FILE_LINKS_DOMAIN, S3_UPLOAD_MAX_SIZE, S3_UPLOAD_CONTENT_TYPES
+
+
+def _builder(trusted: bool):
+    """`model_construct` for data that came from our own database, full validation otherwise"""
+    if trusted:
+        return lambda model, **fields: model.model_construct(**fields)
+    return lambda model, **fields: model(**fields)
 
 
 class OfferSchema(BaseModel):
@@ -37,13 +44,20 @@ class OfferInternal(BaseModel):
 
     files: Optional[List['FileRead']]
 
+    def to_json(self) -> bytes:
+        """Serializes straight to JSON bytes, skipping FastAPI's response re-validation"""
+        return self.__pydantic_serializer__.to_json(self)
+
 
 class OfferPublic(OfferInternal):
     user: Optional[UserRead]
 
     @classmethod
-    def offer_public_view(cls, offer):
-        return cls(
+    def offer_public_view(cls, offer, urls: dict = None, trusted: bool = True):
+        """`trusted` builds the view from ORM rows without re-validating them"""
+        build = _builder(trusted)
+        return build(
+            cls,
             id=offer.id,
             user_id=None if offer.is_anonymous else offer.user_id,
             title=offer.title,
@@ -54,17 +68,19 @@ class OfferPublic(OfferInternal):
             is_closed=offer.is_closed,
             deadline=offer.deadline,
             created_at=offer.created_at,
-            user=UserRead(
+            user=build(
+                UserRead,
                 id=offer.user.id,
                 email=offer.user.email,
-                personal_data=PersonalDataSchema(
+                personal_data=build(
+                    PersonalDataSchema,
                     first_name=offer.user.personal_data.first_name,
                     patronymic=offer.user.personal_data.patronymic,
                     surname=offer.user.personal_data.surname,
                     tg_nickname=offer.user.personal_data.tg_nickname
                 ) if offer.user.personal_data else None
             ) if not offer.is_anonymous else None,
-            files=[FileRead.file_view(file) for file in offer.files]
+            files=[FileRead.file_view(file, (urls or {}).get(file.storage_key), trusted) for file in offer.files]
         )
 
 
@@ -72,8 +88,11 @@ class OfferPrivate(OfferInternal):
     executors: List['ExecutorInternal']
 
     @classmethod
-    def offer_private_view(cls, offer):
-        return cls(
+    def offer_private_view(cls, offer, urls: dict = None, trusted: bool = True):
+        """`trusted` builds the view from ORM rows without re-validating them"""
+        build = _builder(trusted)
+        return build(
+            cls,
             id=offer.id,
             user_id=offer.user_id,
             title=offer.title,
@@ -84,17 +103,20 @@ class OfferPrivate(OfferInternal):
             is_closed=offer.is_closed,
             deadline=offer.deadline,
             created_at=offer.created_at,
-            files=[FileRead.file_view(file) for file in offer.files],
+            files=[FileRead.file_view(file, (urls or {}).get(file.storage_key), trusted) for file in offer.files],
             executors=[
-                ExecutorInternal(
+                build(
+                    ExecutorInternal,
                     id=executor.id,
                     user_id=executor.user_id,
                     offer_id=executor.offer_id,
                     is_approved=executor.is_approved,
-                    user=UserRead(
+                    user=build(
+                        UserRead,
                         id=executor.user.id,
                         email=executor.user.email,
-                        personal_data=PersonalDataSchema(
+                        personal_data=build(
+                            PersonalDataSchema,
                             first_name=executor.user.personal_data.first_name,
                             patronymic=executor.user.personal_data.patronymic,
                             surname=executor.user.personal_data.surname,
@@ -135,15 +157,57 @@ class FileSchema(BaseModel):
         raise ValueError(f'{info.field_name} must be in available domain list')
 
 
+class FileUploadRequest(BaseModel):
+    filename: str
+    content_type: str
+    size: int
+
+    @field_validator('filename')
+    @classmethod
+    def validate_filename(cls, field: str, info: FieldValidationInfo) -> str:
+        if not 0 < len(field) <= 255:
+            raise ValueError(f'{info.field_name} must be between 1 and 255 symbols')
+        if field in ('.', '..') or any(char in '/\\' or not char.isprintable() for char in field):
+            raise ValueError(f'{info.field_name} must not contain path separators or control characters')
+        return field
+
+    @field_validator('size')
+    @classmethod
+    def validate_size(cls, field: int, info: FieldValidationInfo) -> int:
+        if not 0 < field <= S3_UPLOAD_MAX_SIZE:
+            raise ValueError(f'{info.field_name} must be between 1 and {S3_UPLOAD_MAX_SIZE} bytes')
+        return field
+
+    @field_validator('content_type')
+    @classmethod
+    def validate_content_type(cls, field: str, info: FieldValidationInfo) -> str:
+        if field not in S3_UPLOAD_CONTENT_TYPES:
+            raise ValueError(f'{info.field_name} must be in available content type list')
+        return field
+
+
+class FileUploadComplete(BaseModel):
+    key: str
+    description: Optional[str] = None
+
+
 class FileRead(FileSchema):
     id: UUID
     offer_id: UUID
+    url: Optional[str] = None
 
     @classmethod
-    def file_view(cls, file):
-        return cls(
+    def file_view(cls, file, url: str = None, trusted: bool = True):
+        return _builder(trusted)(
+            cls,
             id=file.id,
             offer_id=file.offer_id,
             link=file.link,
-            description=file.description
+            description=file.description,
+            url=url,
         )
+
+
+# Forward references have to be resolved before `model_construct` instances get serialized
+OfferPublic.model_rebuild()
+OfferPrivate.model_rebuild()
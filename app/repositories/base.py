@@ -1,13 +1,23 @@
 from abc import ABC, abstractmethod
-from typing import List
+from typing import List, Optional
 
 from sqlalchemy.orm import lazyload
 
-from core.database import async_session, Base
-from sqlalchemy import select, update
+from repositories.pagination import encode_cursor, decode_cursor
+from sqlalchemy.ext.asyncio import AsyncSession
+from core.routing import USE_PRIMARY
+from sqlalchemy import select, update, tuple_
 
 
 class BaseRepository(ABC):
+    @abstractmethod
+    async def commit(self):
+        pass
+
+    @abstractmethod
+    async def rollback(self):
+        pass
+
     @abstractmethod
     async def add(self, *args, **kwargs):
         pass
@@ -40,67 +50,161 @@ class BaseRepository(ABC):
     def select_with_options(self, *args, **kwargs):
         pass
 
+    @abstractmethod
+    async def select_page(self, *args, **kwargs):
+        pass
+
+    @abstractmethod
+    def projection(self, *args, **kwargs):
+        pass
+
+    @abstractmethod
+    def use_primary(self):
+        pass
+
+    @abstractmethod
+    async def select_window(self, *args, **kwargs):
+        pass
+
 
 class DatabaseRepository(BaseRepository):
+    """Runs every statement on the session it was created with.
+
+    The session is request-scoped (see `repositories.dependencies`), so all repositories
+    used by one request share a connection and a transaction. Writes are only flushed,
+    nothing is persisted until `commit` is called.
+    """
     _model = None
+    _cursor_fields = ('created_at', 'id')
+
+    def __init__(self, session: AsyncSession):
+        self.session: AsyncSession = session
+
+    def use_primary(self):
+        """Routes the rest of the session to the primary, see `core.routing.RoutingSession`"""
+        self.session.info[USE_PRIMARY] = True
 
-    @classmethod
-    async def add(cls, **kwargs):
-        async with async_session() as session:
-            obj = cls._model(**kwargs)
-            session.add(obj)
-            await session.commit()
-            return obj
-
-    @classmethod
-    async def get(cls, *args):
-        async with async_session() as session:
-            statement = select(cls._model).where(*args)
-            res = await session.scalar(statement)
-            return res
-
-    @classmethod
-    async def delete(cls, obj):
-        async with async_session() as session:
-            await session.delete(obj)
-            await session.commit()
-
-    @classmethod
-    async def update(cls, *args, **kwargs):
-        async with async_session() as session:
-            statement = update(cls._model).where(*args).values(**kwargs).returning(cls._model)
-            res = await session.scalar(statement)
-            await session.commit()
-            return res
-
-    @classmethod
-    async def select(cls, *args):
-        async with async_session() as session:
-            statement = select(cls._model).where(*args)
-            res = await session.execute(statement)
-            return res.scalars().all()
-
-    @classmethod
-    async def get_with_options(cls, load_options, *args):
-        async with async_session() as session:
-            statement = select(cls._model).where(*args).options(*load_options)
-            res = await session.scalar(statement)
-            return res
-
-    @classmethod
-    async def select_with_options(cls, load_options, *args):
-        async with async_session() as session:
-            statement = select(cls._model).where(*args).options(
-                *load_options if isinstance(load_options, list) else load_options)
-            res = await session.execute(statement)
-            return res.scalars().all()
-
-    @classmethod
-    async def select_join(cls, join_models: List, *filters):
-        async with async_session() as session:
-            statement = select(cls._model, *[model.get('target') for model in join_models])
-            for model in join_models:
-                statement = statement.join(**model)
-            statement = statement.where(*filters)
-            res = await session.execute(statement)
+    async def commit(self):
+        await self.session.commit()
+
+    async def rollback(self):
+        await self.session.rollback()
+
+    async def add(self, **kwargs):
+        obj = self._model(**kwargs)
+        self.session.add(obj)
+        await self.session.flush()
+        return obj
+
+    async def get(self, *args):
+        statement = select(self._model).where(*args)
+        return await self.session.scalar(statement)
+
+    async def delete(self, obj):
+        await self.session.delete(obj)
+        await self.session.flush()
+
+    async def update(self, *args, **kwargs):
+        statement = update(self._model).where(*args).values(**kwargs).returning(self._model)
+        return await self.session.scalar(statement)
+
+    async def select(self, *args):
+        statement = select(self._model).where(*args)
+        res = await self.session.execute(statement)
+        return res.scalars().all()
+
+    async def get_with_options(self, load_options, *args):
+        statement = select(self._model).where(*args).options(
+            *load_options if isinstance(load_options, list) else load_options)
+        return await self.session.scalar(statement)
+
+    async def select_with_options(self, load_options, *args):
+        statement = select(self._model).where(*args).options(
+            *load_options if isinstance(load_options, list) else load_options)
+        res = await self.session.execute(statement)
+        return res.scalars().all()
+
+    async def select_join(self, join_models: List, *filters):
+        statement = select(self._model, *[model.get('target') for model in join_models])
+        for model in join_models:
+            statement = statement.join(**model)
+        statement = statement.where(*filters)
+        res = await self.session.execute(statement)
         return [x[0] for x in res.fetchall()]
+
+    def projection(self, fields: Optional[str] = None) -> List:
+        """Table columns named in comma separated `fields`, every column if empty"""
+        table_columns = self._model.__table__.columns
+        if not fields:
+            return list(table_columns)
+        names = list(dict.fromkeys(name.strip() for name in fields.split(',') if name.strip()))
+        unknown = [name for name in names if name not in table_columns]
+        if unknown:
+            raise ValueError(f'Unknown fields: {", ".join(unknown)}')
+        return [table_columns[name] for name in names]
+
+    async def select_page(self, limit: int, cursor: Optional[str], *filters, join_models: List = None,
+                          columns: List = None):
+        """Keyset page ordered by `_cursor_fields` descending, returns (items, next_cursor).
+
+        With `columns` only those columns are selected through Core and items are plain
+        dicts, skipping ORM instances and the identity map altogether.
+        """
+        created_at, _id = (getattr(self._model, field) for field in self._cursor_fields)
+        if columns:
+            # Cursor columns are always fetched to build next_cursor, then dropped if not requested
+            hidden = [field for field in self._cursor_fields if field not in {column.key for column in columns}]
+            statement = select(*columns, *(getattr(self._model, field) for field in hidden))
+        else:
+            statement = select(self._model)
+        for model in join_models or []:
+            statement = statement.join(**model)
+        if cursor:
+            statement = statement.where(tuple_(created_at, _id) < decode_cursor(cursor))
+        statement = statement.where(*filters).order_by(created_at.desc(), _id.desc()).limit(limit + 1)
+        if not columns:
+            res = await self.session.scalars(statement)
+            items = res.all()
+            if len(items) <= limit:
+                return items, None
+            items = items[:limit]
+            return items, encode_cursor(*(getattr(items[-1], field) for field in self._cursor_fields))
+        res = await self.session.execute(statement)
+        items = [dict(row) for row in res.mappings()]
+        next_cursor = None
+        if len(items) > limit:
+            items = items[:limit]
+            next_cursor = encode_cursor(*(items[-1][field] for field in self._cursor_fields))
+        for item in items if hidden else []:
+            for field in hidden:
+                del item[field]
+        return items, next_cursor
+
+    async def select_window(self, limit: int, *filters, before=None, after=None, columns: List = None):
+        """Keyset window next to the row with id `before` or `after`, newest rows if neither is given.
+
+        Returns (items, has_more) with items in ascending `_cursor_fields` order. With `columns`
+        only those columns are selected and items are plain dicts instead of ORM objects.
+        Raises LookupError if the anchor row does not match `filters`.
+        """
+        created_at, _id = (getattr(self._model, field) for field in self._cursor_fields)
+        statement = select(*columns) if columns else select(self._model)
+        statement = statement.where(*filters)
+        anchor = before or after
+        if anchor:
+            anchor_created_at = await self.session.scalar(select(created_at).where(_id == anchor, *filters))
+            if anchor_created_at is None:
+                raise LookupError('Anchor not found')
+            anchor_key = tuple_(anchor_created_at, anchor)
+            statement = statement.where(
+                tuple_(created_at, _id) > anchor_key if after else tuple_(created_at, _id) < anchor_key
+            )
+        if after:
+            statement = statement.order_by(created_at.asc(), _id.asc())
+        else:
+            statement = statement.order_by(created_at.desc(), _id.desc())
+        res = await self.session.execute(statement.limit(limit + 1))
+        items = [dict(row) for row in res.mappings()] if columns else res.scalars().all()
+        has_more = len(items) > limit
+        items = items[:limit]
+        return (items if after else items[::-1]), has_more
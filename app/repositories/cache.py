@@ -0,0 +1,206 @@
+from core.config import SERVICE_CACHE_CHANNEL, SERVICE_CACHE_KEY, SERVICE_CACHE_L1_SIZE
+from typing import Any, Awaitable, Callable, Dict, Optional
+from datetime import date, datetime
+from core.redis import redis_session
+from collections import OrderedDict
+from sqlalchemy import inspect, and_
+from time import monotonic
+from uuid import UUID, uuid4
+import hashlib
+import asyncio
+import json
+
+MISSING = object()
+
+
+class ServiceCache:
+    """Opt-in two-tier cache for `Service.get` / `Service.select` of one repository.
+
+    L1 is a size-bounded LRU per worker, L2 is Redis shared by all workers. Only column
+    values are cached, hits return fresh transient model instances, so cached objects are
+    never shared between request sessions. A write through a service using this cache
+    drops both tiers and publishes the namespace on `SERVICE_CACHE_CHANNEL`, so every
+    other worker clears its L1 too. Meant for near-static tables (categories, types).
+    """
+    registry: Dict[str, 'ServiceCache'] = {}
+
+    def __init__(self, namespace: str, model, ttl: int, maxsize: int = SERVICE_CACHE_L1_SIZE,
+                 version_key: Optional[str] = None):
+        self.namespace: str = namespace
+        self.version_key: Optional[str] = version_key
+        self.__version: Optional[str] = None
+        self.model = model
+        self.ttl: int = ttl
+        self.maxsize: int = maxsize
+        self.redis = redis_session()
+        self.__local: OrderedDict = OrderedDict()
+        self.__columns = {column.key: column for column in inspect(model).columns}
+        self.hits: int = 0
+        self.redis_hits: int = 0
+        self.misses: int = 0
+        self.invalidations: int = 0
+        ServiceCache.registry[namespace] = self
+
+    def key(self, method: str, filters: tuple) -> str:
+        if not filters:
+            return f'{method}:'
+        compiled = and_(*filters).compile()
+        raw = f'{compiled.string}|{sorted((k, repr(v)) for k, v in compiled.params.items())}'
+        return f'{method}:{hashlib.sha1(raw.encode()).hexdigest()}'
+
+    async def fetch(self, method: str, filters: tuple, loader: Callable[[], Awaitable[Any]]):
+        key = self.key(method, filters)
+        rows = self.__get_local(key)
+        if rows is MISSING:
+            rows = await self.__get_redis(key)
+            if rows is MISSING:
+                self.misses += 1
+                # An invalidation while the loader runs changes the generation, the result is not cached then
+                generation = await self.redis.get(self.__generation_key)
+                res = await loader()
+                rows = self.__dump(res)
+                await self.__set(key, rows, generation)
+                return res
+            self.redis_hits += 1
+            self.__set_local(key, rows)
+        else:
+            self.hits += 1
+        return self.__load(rows)
+
+    async def version(self) -> Optional[str]:
+        """Opaque token that changes on every invalidation, shared by caches with the same `version_key`"""
+        if self.version_key is None:
+            return None
+        if self.__version is None:
+            # SET NX keeps the token stable across workers, a random one never repeats after a Redis flush
+            await self.redis.set(self.version_key, uuid4().hex, nx=True)
+            version = await self.redis.get(self.version_key)
+            self.__version = version.decode() if isinstance(version, bytes) else version
+        return self.__version
+
+    async def invalidate(self):
+        self.clear_local()
+        self.invalidations += 1
+        # Before collecting the keys, so a concurrent `__set` either sees the new generation or gets deleted here
+        await self.redis.set(self.__generation_key, uuid4().hex)
+        keys_set = f'{SERVICE_CACHE_KEY}:{self.namespace}:keys'
+        keys = await self.redis.smembers(keys_set)
+        await self.redis.delete(keys_set, *keys)
+        await self.redis.publish(SERVICE_CACHE_CHANNEL, self.namespace)
+
+    def clear_local(self):
+        self.__local.clear()
+        self.__version = None
+
+    def forget_version(self):
+        self.__version = None
+
+    @property
+    def stats(self) -> dict:
+        return {
+            'size': len(self.__local),
+            'hits': self.hits,
+            'redis_hits': self.redis_hits,
+            'misses': self.misses,
+            'invalidations': self.invalidations,
+        }
+
+    def __get_local(self, key: str):
+        entry = self.__local.get(key)
+        if entry is None:
+            return MISSING
+        expires_at, rows = entry
+        if expires_at < monotonic():
+            del self.__local[key]
+            return MISSING
+        self.__local.move_to_end(key)
+        return rows
+
+    def __set_local(self, key: str, rows):
+        self.__local[key] = (monotonic() + self.ttl, rows)
+        self.__local.move_to_end(key)
+        while len(self.__local) > self.maxsize:
+            self.__local.popitem(last=False)
+
+    async def __get_redis(self, key: str):
+        value = await self.redis.get(f'{SERVICE_CACHE_KEY}:{self.namespace}:{key}')
+        return MISSING if value is None else json.loads(value)
+
+    @property
+    def __generation_key(self) -> str:
+        """Changed by every invalidation, the shared version key doubles as it when set"""
+        return self.version_key or f'{SERVICE_CACHE_KEY}:{self.namespace}:generation'
+
+    async def __set(self, key: str, rows, generation):
+        redis_key = f'{SERVICE_CACHE_KEY}:{self.namespace}:{key}'
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.setex(redis_key, self.ttl, json.dumps(rows, default=str))
+            pipe.sadd(f'{SERVICE_CACHE_KEY}:{self.namespace}:keys', redis_key)
+            pipe.expire(f'{SERVICE_CACHE_KEY}:{self.namespace}:keys', self.ttl)
+            pipe.get(self.__generation_key)
+            *_, current = await pipe.execute()
+        if current != generation:
+            await self.redis.delete(redis_key)
+            return
+        self.__set_local(key, rows)
+
+    def __dump(self, res):
+        if res is None:
+            return None
+        if isinstance(res, (list, tuple)):
+            return [self.__dump_row(obj) for obj in res]
+        return self.__dump_row(res)
+
+    def __dump_row(self, obj) -> dict:
+        return {key: self.__encode(getattr(obj, key)) for key in self.__columns}
+
+    def __load(self, rows):
+        if rows is None:
+            return None
+        if isinstance(rows, list):
+            return [self.__load_row(row) for row in rows]
+        return self.__load_row(rows)
+
+    def __load_row(self, row: dict):
+        return self.model(**{key: self.__decode(key, value) for key, value in row.items()})
+
+    @staticmethod
+    def __encode(value):
+        if isinstance(value, UUID):
+            return value.__str__()
+        if isinstance(value, (date, datetime)):
+            return value.isoformat()
+        return value
+
+    def __decode(self, key: str, value):
+        if value is None:
+            return None
+        try:
+            python_type = self.__columns[key].type.python_type
+        except NotImplementedError:
+            return value
+        if python_type is UUID:
+            return UUID(value)
+        if python_type in (date, datetime):
+            return python_type.fromisoformat(value)
+        return value
+
+
+async def listen_invalidations(hub):
+    """Clears this worker's L1 when any worker publishes an invalidation, runs for the app lifetime"""
+    subscription = await hub.subscribe(SERVICE_CACHE_CHANNEL)
+    try:
+        while True:
+            namespace = await subscription.get()
+            invalidated: Optional[ServiceCache] = ServiceCache.registry.get(namespace)
+            if invalidated is None:
+                continue
+            # Caches sharing the version key see a new version too, drop their memoized copy
+            for cache in ServiceCache.registry.values():
+                if cache is invalidated:
+                    cache.clear_local()
+                elif invalidated.version_key and cache.version_key == invalidated.version_key:
+                    cache.forget_version()
+    except asyncio.CancelledError:
+        await hub.unsubscribe(subscription)
+        raise
@@ -1,4 +1,10 @@
-from repositories.services import Service
+from sqlalchemy.ext.asyncio import AsyncSession
+from core.database import get_async_session
+from core.config import CATEGORY_CACHE_TTL_SECONDS, OFFER_TYPE_CACHE_TTL_SECONDS, CATALOG_VERSION_KEY
+from repositories.services import Service, ChatService, OfferService
+from repositories.cache import ServiceCache
+from offer.models import Category, OfferType
+from fastapi import Depends
 from repositories.repositories import (
     UserRepository,
     OfferRepository,
@@ -12,41 +18,46 @@ from repositories.repositories import (
 )
 
 
-def user_service() -> Service:
-    return Service(UserRepository)
+category_cache = ServiceCache('categories', Category, ttl=CATEGORY_CACHE_TTL_SECONDS, version_key=CATALOG_VERSION_KEY)
+offer_type_cache = ServiceCache('offer_types', OfferType, ttl=OFFER_TYPE_CACHE_TTL_SECONDS,
+                                version_key=CATALOG_VERSION_KEY)
 
 
-def offer_service() -> Service:
-    return Service(OfferRepository)
+def user_service(session: AsyncSession = Depends(get_async_session)) -> Service:
+    return Service(UserRepository(session))
 
 
-def category_service() -> Service:
-    return Service(CategoryRepository)
+def offer_service(session: AsyncSession = Depends(get_async_session)) -> OfferService:
+    return OfferService(OfferRepository(session))
 
 
-def offer_type_service() -> Service:
-    return Service(OfferTypeRepository)
+def category_service(session: AsyncSession = Depends(get_async_session)) -> Service:
+    return Service(CategoryRepository(session), cache=category_cache)
 
 
-def personal_data_service() -> Service:
-    return Service(PersonalDataRepository)
+def offer_type_service(session: AsyncSession = Depends(get_async_session)) -> Service:
+    return Service(OfferTypeRepository(session), cache=offer_type_cache)
 
 
-def executor_service() -> Service:
-    return Service(ExecutorRepository)
+def personal_data_service(session: AsyncSession = Depends(get_async_session)) -> Service:
+    return Service(PersonalDataRepository(session))
 
 
-def file_service() -> Service:
-    return Service(FileRepository)
+def executor_service(session: AsyncSession = Depends(get_async_session)) -> Service:
+    return Service(ExecutorRepository(session))
 
 
-def chat_service() -> Service:
-    return Service(ChatRepository)
+def file_service(session: AsyncSession = Depends(get_async_session)) -> Service:
+    return Service(FileRepository(session))
 
 
-def message_service() -> Service:
-    return Service(MessageRepository)
+def chat_service(session: AsyncSession = Depends(get_async_session)) -> ChatService:
+    return ChatService(ChatRepository(session))
 
 
-def user_verify_service() -> Service:
-    return Service(UserVerifyRepository)
+def message_service(session: AsyncSession = Depends(get_async_session)) -> Service:
+    return Service(MessageRepository(session))
+
+
+def user_verify_service(session: AsyncSession = Depends(get_async_session)) -> Service:
+    return Service(UserVerifyRepository(session))
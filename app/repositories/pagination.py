@@ -0,0 +1,18 @@
+from datetime import datetime
+from typing import Tuple
+from uuid import UUID
+import base64
+import json
+
+
+def encode_cursor(created_at: datetime, _id: UUID) -> str:
+    raw = json.dumps([created_at.isoformat(), str(_id)])
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, UUID]:
+    try:
+        created_at, _id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return datetime.fromisoformat(created_at), UUID(_id)
+    except (ValueError, TypeError) as e:
+        raise ValueError('Invalid pagination cursor') from e
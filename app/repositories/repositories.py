@@ -1,7 +1,12 @@
+from repositories.pagination import encode_cursor, decode_cursor
+from sqlalchemy import select, update, func, true, tuple_, union_all
 from repositories.base import DatabaseRepository
 from auth.models import User, PersonalData, UserVerifyInfo
 from offer.models import Offer, Category, OfferType, Executor, FileOffer
 from chat.models import Chat, Message
+from typing import Optional, Tuple
+from uuid import UUID
+from datetime import datetime
 
 
 class UserRepository(DatabaseRepository):
@@ -11,6 +16,15 @@ class UserRepository(DatabaseRepository):
 class OfferRepository(DatabaseRepository):
     _model = Offer
 
+    async def bump_version(self, *filters):
+        statement = update(Offer).where(*filters).values(
+            version=Offer.version + 1, updated_at=datetime.utcnow()
+        ).execution_options(synchronize_session=False)
+        await self.session.execute(statement)
+
+    async def get_version(self, *filters) -> Optional[int]:
+        return await self.session.scalar(select(Offer.version).where(*filters))
+
 
 class CategoryRepository(DatabaseRepository):
     _model = Category
@@ -34,6 +48,88 @@ class FileRepository(DatabaseRepository):
 
 class ChatRepository(DatabaseRepository):
     _model = Chat
+    _cursor_fields = ('last_message_at', 'id')
+
+    @staticmethod
+    def inbox_statement(user_id, limit: int, after: Optional[Tuple[datetime, UUID]] = None):
+        """Statement behind `select_inbox`, also checked by scripts/explain_queries.py"""
+        # Two indexed lookups instead of an OR of IN subqueries, which Postgres can only run as a Seq Scan
+        own_chats = union_all(
+            select(Chat.id).join(Offer, Offer.id == Chat.offer_id).where(Offer.user_id == user_id),
+            select(Chat.id).join(Executor, Executor.id == Chat.executor_id).where(Executor.user_id == user_id),
+        )
+        page = select(Chat).where(Chat.id.in_(own_chats))
+        if after:
+            page = page.where(tuple_(Chat.last_message_at, Chat.id) < after)
+        page = page.order_by(Chat.last_message_at.desc(), Chat.id.desc()).limit(limit + 1).subquery('page')
+        last_message = (
+            select(Message.id, Message.owner_id, Message.content, Message.created_at)
+            .where(Message.chat_id == page.c.id)
+            .order_by(Message.created_at.desc(), Message.id.desc())
+            .limit(1)
+            .lateral('last_message')
+        )
+        unread = (
+            select(func.count().label('unread_count'))
+            .where(Message.chat_id == page.c.id, Message.recipient_id == user_id, Message.read_at.is_(None))
+            .lateral('unread')
+        )
+        return (
+            select(
+                page.c.id, page.c.chat_name, page.c.offer_id, page.c.executor_id,
+                page.c.created_at, page.c.last_message_at,
+                last_message.c.id.label('last_message_id'),
+                last_message.c.owner_id.label('last_message_owner_id'),
+                last_message.c.content.label('last_message_content'),
+                last_message.c.created_at.label('last_message_created_at'),
+                unread.c.unread_count,
+            )
+            .select_from(page)
+            .outerjoin(last_message, true())
+            .join(unread, true())
+            .order_by(page.c.last_message_at.desc(), page.c.id.desc())
+        )
+
+    async def select_inbox(self, user_id, limit: int, cursor: Optional[str]):
+        """User's chats (as offer owner or executor) by last activity, with last message and unread count.
+
+        One round trip: the page of chats is picked first, then two LATERAL subqueries run only
+        for those rows, using ix_messages_chat_created_at and ix_messages_unread_recipient_chat.
+        The user's chats are found through ix_offers_user_created_at / ix_executors_user_offer
+        and the chats foreign key indexes, then sorted by last_message_at in memory. A global
+        index on last_message_at can't serve a per-user set, so cost grows with the user's
+        chat count, not with message history. `scripts.explain_queries --analyze` times it.
+        """
+        statement = self.inbox_statement(user_id, limit, decode_cursor(cursor) if cursor else None)
+        res = await self.session.execute(statement)
+        rows = res.mappings().all()
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = encode_cursor(rows[-1]['last_message_at'], rows[-1]['id'])
+        return [
+            {
+                'id': row['id'],
+                'chat_name': row['chat_name'],
+                'offer_id': row['offer_id'],
+                'executor_id': row['executor_id'],
+                'created_at': row['created_at'],
+                'last_message_at': row['last_message_at'],
+                'last_message': {
+                    'id': row['last_message_id'],
+                    'owner_id': row['last_message_owner_id'],
+                    'content': row['last_message_content'],
+                    'created_at': row['last_message_created_at'],
+                } if row['last_message_id'] else None,
+                'unread_count': row['unread_count'],
+            } for row in rows
+        ], next_cursor
+
+    async def mark_read(self, chat_id, user_id):
+        statement = update(Message).where(
+            Message.chat_id == chat_id, Message.recipient_id == user_id, Message.read_at.is_(None)
+        ).values(read_at=datetime.utcnow())
+        await self.session.execute(statement)
 
 
 class MessageRepository(DatabaseRepository):
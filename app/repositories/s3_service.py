@@ -1,60 +1,336 @@
-import aioboto3
 from core.config import AWS_ACCESS_KEY_ID, AWS_SECRET_ACCESS_KEY, BUCKET_NAME, REGION_NAME
-import os
+from core.config import S3_ENDPOINT_URL, S3_MAX_POOL_CONNECTIONS, S3_CONNECT_TIMEOUT, S3_READ_TIMEOUT
+from core.config import S3_MULTIPART_PART_SIZE, S3_MULTIPART_CONCURRENCY
+from core.config import S3_PRESIGNED_URL_TTL_SECONDS, S3_PRESIGNED_URL_MIN_TTL_SECONDS, S3_PRESIGNED_URL_CACHE_SIZE
+from contextlib import AsyncExitStack, asynccontextmanager
+from typing import Optional, List, Dict, Iterable, Tuple
+from aiobotocore.config import AioConfig
 from fastapi import File, UploadFile
+from core.redis import redis_session
+from collections import OrderedDict
+from time import perf_counter, time
+import aioboto3
+import asyncio
+import hashlib
+import base64
+import os
+
+# S3 rejects multipart parts smaller than 5 MiB (except the last one)
+MIN_PART_SIZE = 5 * 1024 * 1024
+# Keeps generated keys well inside FileOffer.link
+MAX_EXTENSION_LENGTH = 10
+
+
+class PresignedUrlCache:
+    """In-process LRU in front of Redis for presigned GET URLs.
+
+    Entries are keyed by object key, expiry and expiry bucket. A bucket lasts
+    `expires_in - min_ttl` seconds, so a URL signed anywhere inside a bucket still has at
+    least `min_ttl` seconds of life when the bucket ends and both tiers drop it.
+    """
+    def __init__(self, min_ttl: int, maxsize: int):
+        self.min_ttl: int = min_ttl
+        self.maxsize: int = maxsize
+        self.redis = redis_session()
+        self.__local: OrderedDict = OrderedDict()
+        self.hits: int = 0
+        self.redis_hits: int = 0
+        self.misses: int = 0
+
+    def bucket(self, expires_in: int) -> Tuple[int, int]:
+        """Current bucket number and seconds until it ends"""
+        length = max(expires_in - self.min_ttl, 1)
+        now = time()
+        number = int(now // length)
+        return number, max(int((number + 1) * length - now), 1)
+
+    async def get_many(self, keys: List[str], expires_in: int) -> Tuple[Dict[str, str], List[str]]:
+        number, _ = self.bucket(expires_in)
+        found, missing = {}, []
+        for key in keys:
+            url = self.__local.get((number, expires_in, key))
+            if url is None:
+                missing.append(key)
+                continue
+            self.__local.move_to_end((number, expires_in, key))
+            found[key] = url
+        self.hits += len(found)
+        if not missing:
+            return found, missing
+        values = await self.redis.mget([f'presigned:{expires_in}:{number}:{key}' for key in missing])
+        still_missing = []
+        for key, value in zip(missing, values):
+            if value is None:
+                still_missing.append(key)
+                continue
+            found[key] = value.decode() if isinstance(value, bytes) else value
+            self.__remember((number, expires_in, key), found[key])
+            self.redis_hits += 1
+        self.misses += len(still_missing)
+        return found, still_missing
+
+    async def set_many(self, urls: Dict[str, str], expires_in: int):
+        if not urls:
+            return
+        number, ttl = self.bucket(expires_in)
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for key, url in urls.items():
+                pipe.setex(f'presigned:{expires_in}:{number}:{key}', ttl, url)
+                self.__remember((number, expires_in, key), url)
+            await pipe.execute()
+
+    def __remember(self, cache_key: tuple, url: str):
+        self.__local[cache_key] = url
+        self.__local.move_to_end(cache_key)
+        while len(self.__local) > self.maxsize:
+            self.__local.popitem(last=False)
 
 
 class S3Service:
+    """S3 operations over one long-lived client per worker.
+
+    `start` is called from the app lifespan and `close` on shutdown, so TLS connections and
+    resolved credentials are reused by every call instead of being set up per request.
+    Outside the app (scripts) the first operation starts the client, under a lock so
+    concurrent first calls share it.
+    `S3_ENDPOINT_URL` can point at any S3-compatible stand-in (e.g. MinIO) for local testing.
+    """
     __session = aioboto3.Session(
         aws_access_key_id=AWS_ACCESS_KEY_ID,
         aws_secret_access_key=AWS_SECRET_ACCESS_KEY,
         region_name=REGION_NAME,
     )
     __service_name = 's3'
-    __endpoint_url = 'https://storage.yandexcloud.net'
+    __endpoint_url = S3_ENDPOINT_URL
+    __config = AioConfig(
+        max_pool_connections=S3_MAX_POOL_CONNECTIONS,
+        connect_timeout=S3_CONNECT_TIMEOUT,
+        read_timeout=S3_READ_TIMEOUT,
+        retries={'max_attempts': 3, 'mode': 'standard'},
+    )
+    __client = None
+    __exit_stack: Optional[AsyncExitStack] = None
+    __url_cache = PresignedUrlCache(min_ttl=S3_PRESIGNED_URL_MIN_TTL_SECONDS, maxsize=S3_PRESIGNED_URL_CACHE_SIZE)
+    __start_lock = asyncio.Lock()
+    __clients_created: int = 0
+    __in_flight: int = 0
+    __calls: dict = {}
 
     @classmethod
     async def __call__(cls):
         return cls
 
+    @classmethod
+    async def start(cls):
+        async with cls.__start_lock:
+            if cls.__client is not None:
+                return
+            exit_stack = AsyncExitStack()
+            cls.__client = await exit_stack.enter_async_context(
+                cls.__session.client(cls.__service_name, endpoint_url=cls.__endpoint_url, config=cls.__config)
+            )
+            cls.__exit_stack = exit_stack
+            cls.__clients_created += 1
+
+    @classmethod
+    def use_client(cls, client, redis=None):
+        """Serves every operation from `client` (and the URL cache from `redis`), for in-process stand-ins"""
+        cls.__client = client
+        if redis is not None:
+            cls.__url_cache.redis = redis
+
+    @classmethod
+    async def close(cls):
+        if cls.__exit_stack is not None:
+            await cls.__exit_stack.aclose()
+        cls.__client = None
+        cls.__exit_stack = None
+
+    @classmethod
+    @asynccontextmanager
+    async def __operation(cls, name: str):
+        if cls.__client is None:
+            await cls.start()
+        cls.__in_flight += 1
+        started = perf_counter()
+        try:
+            yield cls.__client
+        finally:
+            cls.__in_flight -= 1
+            count, total = cls.__calls.get(name, (0, 0.0))
+            cls.__calls[name] = (count + 1, total + perf_counter() - started)
+
+    @classmethod
+    def stats(cls) -> dict:
+        return {
+            # Operations, not pooled connections: botocore doesn't expose its connection pool
+            'clients_created': cls.__clients_created,
+            'pool_connections_limit': S3_MAX_POOL_CONNECTIONS,
+            'operations_in_flight': cls.__in_flight,
+            'calls': {name: {'count': count, 'seconds_total': total} for name, (count, total) in cls.__calls.items()},
+            'presigned_url_cache': {
+                'hits': cls.__url_cache.hits,
+                'redis_hits': cls.__url_cache.redis_hits,
+                'misses': cls.__url_cache.misses,
+            },
+        }
+
     @classmethod
     async def upload_file(cls, file: UploadFile = File(...)):
-        async with cls.__session.client(cls.__service_name, endpoint_url=cls.__endpoint_url) as client:
-            unique_filename = cls.__generate_unique_filename(file.filename)
-            await client.upload_fileobj(file, BUCKET_NAME, unique_filename)
+        unique_filename = cls.__generate_unique_filename(file.filename)
+        async with cls.__operation('upload_file') as client:
+            await cls.__upload(client, file, unique_filename)
         return unique_filename
 
     @classmethod
-    async def get_presigned_url(cls, file_name):
-        async with cls.__session.client(cls.__service_name, endpoint_url=cls.__endpoint_url) as client:
-            url = await client.generate_presigned_url(
-                'get_object',
-                Params={"Bucket": BUCKET_NAME, "Key": file_name},
-                ExpiresIn=300
+    async def __upload(cls, client, file: UploadFile, key: str, part_size: int = S3_MULTIPART_PART_SIZE,
+                       concurrency: int = S3_MULTIPART_CONCURRENCY):
+        """Single PUT for files smaller than one part, concurrent multipart upload otherwise"""
+        part_size = max(part_size, MIN_PART_SIZE)
+        chunk = await file.read(part_size)
+        if len(chunk) < part_size:
+            await client.put_object(
+                Bucket=BUCKET_NAME, Key=key, Body=chunk,
+                ContentMD5=await asyncio.to_thread(cls.__content_md5, chunk),
+                ContentType=file.content_type or 'application/octet-stream',
+            )
+            return
+        await cls.__multipart_upload(client, file, key, chunk, part_size, concurrency)
+
+    @classmethod
+    async def __multipart_upload(cls, client, file: UploadFile, key: str, first_chunk: bytes,
+                                 part_size: int, concurrency: int):
+        """Streams `file` in `part_size` parts with at most `concurrency` parts in flight.
+
+        A part is only read once an upload slot is free, so memory per upload stays around
+        part_size * concurrency whatever the file size. Each part carries a Content-MD5 the
+        storage verifies. Any failure aborts the upload so no orphaned parts are billed.
+        """
+        upload = await client.create_multipart_upload(
+            Bucket=BUCKET_NAME, Key=key, ContentType=file.content_type or 'application/octet-stream'
+        )
+        upload_id = upload['UploadId']
+        slots = asyncio.Semaphore(concurrency)
+        tasks: List[asyncio.Task] = []
+
+        async def upload_part(part_number: int, body: bytes) -> dict:
+            try:
+                res = await client.upload_part(
+                    Bucket=BUCKET_NAME, Key=key, UploadId=upload_id, PartNumber=part_number, Body=body,
+                    ContentMD5=await asyncio.to_thread(cls.__content_md5, body),
+                )
+                return {'PartNumber': part_number, 'ETag': res['ETag']}
+            finally:
+                slots.release()
+
+        try:
+            chunk, part_number = first_chunk, 1
+            await slots.acquire()
+            while chunk:
+                tasks.append(asyncio.create_task(upload_part(part_number, chunk)))
+                await slots.acquire()
+                for task in tasks:
+                    if task.done() and task.exception():
+                        raise task.exception()
+                chunk, part_number = await file.read(part_size), part_number + 1
+            slots.release()
+            parts = await asyncio.gather(*tasks)
+            await client.complete_multipart_upload(
+                Bucket=BUCKET_NAME, Key=key, UploadId=upload_id, MultipartUpload={'Parts': parts}
+            )
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await client.abort_multipart_upload(Bucket=BUCKET_NAME, Key=key, UploadId=upload_id)
+            raise
+
+    @staticmethod
+    def __content_md5(body: bytes) -> str:
+        return base64.b64encode(hashlib.md5(body).digest()).decode()
+
+    @classmethod
+    async def get_presigned_url(cls, file_name, expires_in: int = S3_PRESIGNED_URL_TTL_SECONDS):
+        urls = await cls.get_presigned_urls([file_name], expires_in)
+        return urls[file_name]
+
+    @classmethod
+    async def get_presigned_urls(cls, file_names: Iterable[str],
+                                 expires_in: int = S3_PRESIGNED_URL_TTL_SECONDS) -> Dict[str, str]:
+        """Presigned GET URLs for many keys: cached ones are reused, the rest signed in one pass"""
+        file_names = list(dict.fromkeys(file_names))
+        if not file_names:
+            return {}
+        urls, missing = await cls.__url_cache.get_many(file_names, expires_in)
+        if not missing:
+            return urls
+        async with cls.__operation('get_presigned_urls') as client:
+            signed = {
+                file_name: await client.generate_presigned_url(
+                    'get_object',
+                    Params={"Bucket": BUCKET_NAME, "Key": file_name},
+                    ExpiresIn=expires_in
+                ) for file_name in missing
+            }
+        await cls.__url_cache.set_many(signed, expires_in)
+        urls.update(signed)
+        return urls
+
+    @classmethod
+    def presigned_url_bucket(cls, expires_in: int = S3_PRESIGNED_URL_TTL_SECONDS) -> int:
+        return cls.__url_cache.bucket(expires_in)[0]
+
+    @classmethod
+    async def get_presigned_post(cls, key: str, key_prefix: str, content_type: str, max_size: int,
+                                 expires_in: int) -> dict:
+        """POST policy letting a client upload one object straight to the bucket.
+
+        The policy pins the key under `key_prefix`, the Content-Type and the size range,
+        so the storage rejects anything else without the bytes ever reaching the API.
+        """
+        async with cls.__operation('get_presigned_post') as client:
+            return await client.generate_presigned_post(
+                BUCKET_NAME, key,
+                Fields={'Content-Type': content_type},
+                Conditions=[
+                    ['starts-with', '$key', key_prefix],
+                    {'Content-Type': content_type},
+                    ['content-length-range', 1, max_size],
+                ],
+                ExpiresIn=expires_in,
             )
-        return url
+
+    @classmethod
+    async def head_file(cls, file_name) -> Optional[dict]:
+        async with cls.__operation('head_file') as client:
+            try:
+                return await client.head_object(Bucket=BUCKET_NAME, Key=file_name)
+            except client.exceptions.ClientError as e:
+                if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+                    return None
+                raise
+
+    @classmethod
+    def generate_unique_key(cls, prefix: str, filename: str) -> str:
+        return f'{prefix}{cls.__generate_unique_filename(filename)}'
 
     @classmethod
     async def delete_file(cls, file_name):
-        async with cls.__session.client(cls.__service_name, endpoint_url=cls.__endpoint_url) as client:
+        async with cls.__operation('delete_file') as client:
             response = await client.delete_object(Bucket=BUCKET_NAME, Key=file_name)
         return response
 
     @classmethod
-    async def change_files(self, previous_file_name: str, current_file: UploadFile = File(...)):
-        async with self.__session.client(self.__service_name, endpoint_url=self.__endpoint_url) as client:
+    async def change_files(cls, previous_file_name: str, current_file: UploadFile = File(...)):
+        unique_filename = cls.__generate_unique_filename(current_file.filename)
+        async with cls.__operation('change_files') as client:
             await client.delete_object(Bucket=BUCKET_NAME, Key=previous_file_name)
-            unique_filename = self.__generate_unique_filename(current_file.filename)
-            await client.upload_fileobj(current_file, BUCKET_NAME, unique_filename)
+            await cls.__upload(client, current_file, unique_filename)
         return unique_filename
 
-    async def __get_client_session(self):
-        # TODO: Хуй знает, не работает
-        async with self.__session.client(self.__service_name, endpoint_url=self.__endpoint_url) as client:
-            print(type(client))
-            yield client
-
     @staticmethod
     def __generate_unique_filename(previous_filename: str):
-        extension = previous_filename[previous_filename.rfind('.') + 1:]
-        return f'{os.urandom(16).hex()}.{extension}'
+        extension = os.path.splitext(previous_filename)[1][1:]
+        extension = ''.join(char for char in extension if char.isascii() and char.isalnum())[:MAX_EXTENSION_LENGTH]
+        name = os.urandom(16).hex()
+        return f'{name}.{extension}' if extension else name
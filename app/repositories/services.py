@@ -1,24 +1,57 @@
 from repositories.base import BaseRepository
+from repositories.cache import ServiceCache
+from typing import Optional
 
 
 class Service:
-    def __init__(self, repository: BaseRepository):
+    def __init__(self, repository: BaseRepository, cache: Optional[ServiceCache] = None):
         self.repository: BaseRepository = repository
+        self.cache: Optional[ServiceCache] = cache
+        self.__dirty: bool = False
+
+    async def commit(self):
+        await self.repository.commit()
+        if self.__dirty:
+            # Drop entries a concurrent reader may have refilled from pre-commit data
+            self.__dirty = False
+            await self.cache.invalidate()
+
+    async def __written(self):
+        if self.cache is not None:
+            self.__dirty = True
+            await self.cache.invalidate()
+
+    async def rollback(self):
+        await self.repository.rollback()
 
     async def add(self, **kwargs):
-        return await self.repository.add(**kwargs)
+        obj = await self.repository.add(**kwargs)
+        await self.__written()
+        return obj
+
+    async def __load(self, method, *args):
+        # Shared cache entries outlive replica lag, so they are filled from the primary
+        self.repository.use_primary()
+        return await method(*args)
 
     async def get(self, *args):
-        return await self.repository.get(*args)
+        if self.cache is None:
+            return await self.repository.get(*args)
+        return await self.cache.fetch('get', args, lambda: self.__load(self.repository.get, *args))
 
     async def delete(self, obj):
         await self.repository.delete(obj)
+        await self.__written()
 
     async def update(self, *filters, **kwargs):
-        return await self.repository.update(*filters, **kwargs)
+        obj = await self.repository.update(*filters, **kwargs)
+        await self.__written()
+        return obj
 
     async def select(self, *args):
-        return await self.repository.select(*args)
+        if self.cache is None:
+            return await self.repository.select(*args)
+        return await self.cache.fetch('select', args, lambda: self.__load(self.repository.select, *args))
 
     async def get_with_options(self, option, *args):
         return await self.repository.get_with_options(option, *args)
@@ -28,3 +61,31 @@ class Service:
 
     async def select_with_options(self, options, *args):
         return await self.repository.select_with_options(options, *args)
+
+    async def select_page(self, limit, cursor, *filters, join_models=None, columns=None):
+        return await self.repository.select_page(limit, cursor, *filters, join_models=join_models, columns=columns)
+
+    def projection(self, fields=None):
+        return self.repository.projection(fields)
+
+    def use_primary(self):
+        self.repository.use_primary()
+
+    async def select_window(self, limit, *filters, before=None, after=None, columns=None):
+        return await self.repository.select_window(limit, *filters, before=before, after=after, columns=columns)
+
+
+class OfferService(Service):
+    async def bump_version(self, *filters):
+        await self.repository.bump_version(*filters)
+
+    async def get_version(self, *filters):
+        return await self.repository.get_version(*filters)
+
+
+class ChatService(Service):
+    async def select_inbox(self, user_id, limit, cursor):
+        return await self.repository.select_inbox(user_id, limit, cursor)
+
+    async def mark_read(self, chat_id, user_id):
+        await self.repository.mark_read(chat_id, user_id)
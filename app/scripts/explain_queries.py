@@ -0,0 +1,154 @@
+"""Runs EXPLAIN on the hot API queries and checks that they are served by index scans.
+
+Usage (from the app directory, against a database migrated to head):
+    python -m scripts.explain_queries [--analyze] [--no-seqscan]
+
+On a nearly empty database Postgres prefers sequential scans no matter which indexes
+exist, `--no-seqscan` disables them for the session to check that the indexes are usable.
+With `--analyze` the execution time of every query is printed as well.
+Exit code is 1 if any query still touches a checked table with a Seq Scan.
+"""
+from repositories.repositories import ChatRepository
+from sqlalchemy.dialects import postgresql
+from offer.models import Offer, Executor, FileOffer
+from core.database import async_engine
+from sqlalchemy import select, text, tuple_
+from chat.models import Chat, Message
+from datetime import datetime
+from uuid import uuid4
+import argparse
+import asyncio
+import json
+import sys
+
+INDEX_NODES = {'Index Scan', 'Index Only Scan'}
+
+
+async def sample_value(connection, column):
+    res = await connection.execute(select(column).where(column.is_not(None)).limit(1))
+    value = res.scalar()
+    return value if value is not None else uuid4()
+
+
+async def hot_queries(connection) -> dict:
+    type_id = await sample_value(connection, Offer.type_id)
+    category_id = await sample_value(connection, Offer.category_id)
+    owner_id = await sample_value(connection, Offer.user_id)
+    executor_user_id = await sample_value(connection, Executor.user_id)
+    offer_id = await sample_value(connection, Offer.id)
+    chat_id = await sample_value(connection, Message.chat_id)
+    inbox_user_id = await sample_value(connection, Executor.user_id)
+    cursor = (datetime.utcnow(), uuid4())
+    page = (Offer.created_at.desc(), Offer.id.desc())
+    history = (Message.created_at.desc(), Message.id.desc())
+    return {
+        'offers_main': (select(Offer).order_by(*page).limit(21), 'offers'),
+        'offers_main_open': (
+            select(Offer).where(Offer.is_closed == False)  # noqa: E712
+            .order_by(*page).limit(21),
+            'offers',
+        ),
+        'offers_main_filtered': (
+            select(Offer).where(
+                Offer.is_closed == False,  # noqa: E712
+                Offer.type_id == type_id,
+                Offer.category_id == category_id,
+                tuple_(Offer.created_at, Offer.id) < cursor,
+            ).order_by(*page).limit(21),
+            'offers',
+        ),
+        'offers_main_by_category': (
+            select(Offer).where(
+                Offer.is_closed == False,  # noqa: E712
+                Offer.category_id == category_id,
+            ).order_by(*page).limit(21),
+            'offers',
+        ),
+        'offers_profile': (
+            select(Offer).where(Offer.user_id == owner_id).order_by(*page).limit(21),
+            'offers',
+        ),
+        'offers_responses': (
+            select(Offer).join(Executor, Executor.offer_id == Offer.id)
+            .where(Executor.user_id == executor_user_id).order_by(*page).limit(21),
+            'executors',
+        ),
+        'offer_executors': (select(Executor).where(Executor.offer_id.in_([offer_id])), 'executors'),
+        'offer_files': (select(FileOffer).where(FileOffer.offer_id.in_([offer_id])), 'offer_files'),
+        'offer_chats': (select(Chat).where(Chat.offer_id == offer_id), 'chats'),
+        'chat_messages': (select(Message).where(Message.chat_id == chat_id), 'messages'),
+        # /chat/{chat_id}/messages?before=..., see DatabaseRepository.select_window
+        'chat_history': (
+            select(Message).where(
+                Message.chat_id == chat_id,
+                tuple_(Message.created_at, Message.id) < cursor,
+            ).order_by(*history).limit(51),
+            'messages',
+        ),
+        # /chats, the page of chats and its two LATERAL subqueries
+        'chat_inbox': (ChatRepository.inbox_statement(inbox_user_id, 20), ('chats', 'messages')),
+        'chat_inbox_next_page': (ChatRepository.inbox_statement(inbox_user_id, 20, cursor), ('chats', 'messages')),
+    }
+
+
+def plan_nodes(plan: dict):
+    yield plan
+    for child in plan.get('Plans', []):
+        yield from plan_nodes(child)
+
+
+def table_scans(plan: dict, table: str):
+    """Indexes used to read `table` and whether it is also read with a Seq Scan.
+
+    Bitmap Index Scan nodes carry no relation name, they are attributed to the
+    Bitmap Heap Scan above them.
+    """
+    indexes, seq_scan = set(), False
+    for node in plan_nodes(plan):
+        if node.get('Relation Name') != table:
+            continue
+        if node['Node Type'] == 'Seq Scan':
+            seq_scan = True
+        elif node['Node Type'] in INDEX_NODES:
+            indexes.add(node['Index Name'])
+        elif node['Node Type'] == 'Bitmap Heap Scan':
+            indexes.update(
+                child['Index Name'] for child in plan_nodes(node) if child['Node Type'] == 'Bitmap Index Scan'
+            )
+    return sorted(indexes), seq_scan
+
+
+async def explain(analyze: bool, no_seqscan: bool) -> bool:
+    ok = True
+    async with async_engine.connect() as connection:
+        if no_seqscan:
+            await connection.execute(text('SET enable_seqscan = off'))
+        queries = await hot_queries(connection)
+        for name, (statement, tables) in queries.items():
+            sql = statement.compile(dialect=postgresql.dialect(), compile_kwargs={'literal_binds': True})
+            options = 'ANALYZE, BUFFERS, FORMAT JSON' if analyze else 'FORMAT JSON'
+            res = await connection.execute(text(f'EXPLAIN ({options}) {sql}'))
+            raw = res.scalar()
+            result = (json.loads(raw) if isinstance(raw, str) else raw)[0]
+            plan = result['Plan']
+            for table in (tables,) if isinstance(tables, str) else tables:
+                indexes, seq_scan = table_scans(plan, table)
+                ok = ok and not seq_scan and bool(indexes)
+                status = 'OK  ' if indexes and not seq_scan else 'FAIL'
+                print(f'{status} {name:<26} {table:<12} {", ".join(indexes) or "no index scan"}')
+            if analyze:
+                print(f'     {name:<26} {"":<12} {result["Execution Time"]:.2f} ms')
+    await async_engine.dispose()
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--analyze', action='store_true', help='run EXPLAIN ANALYZE instead of plain EXPLAIN')
+    parser.add_argument('--no-seqscan', action='store_true', help='SET enable_seqscan = off for the session')
+    args = parser.parse_args()
+    sys.exit(0 if asyncio.run(explain(args.analyze, args.no_seqscan)) else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,215 @@
+"""Loads a synthetic, skewed dataset with COPY, deterministic for a given seed.
+
+Usage (from the app directory, against a database migrated to head):
+    python -m scripts.seed --truncate --users 100000 --offers 200000 --chats 20000 --messages 2000000
+
+Skew mirrors production: a few power users own most offers, executors per offer
+follow a Pareto tail with `--hot-offers` offers getting `--max-executors`, and message
+counts per chat follow a Zipf curve with the busiest chat getting `--max-messages`.
+Rows are generated lazily and streamed with asyncpg `copy_records_to_table`.
+Every user's password is `--password`.
+"""
+from core.config import POSTGRES_DB, POSTGRES_HOST, POSTGRES_PORT, POSTGRES_USER, POSTGRES_PASSWORD
+from datetime import datetime, timedelta
+from typing import Iterator, List, Tuple
+from auth.hasher import pwd_context
+from time import perf_counter
+from uuid import UUID
+import argparse
+import asyncio
+import asyncpg
+import random
+
+TABLES = [
+    'messages', 'chats', 'executors', 'offer_files', 'offers', 'personal_data', 'user_verify_info',
+    'password_upd_token', 'users', 'categories', 'offer_type',
+]
+CATEGORIES = ['Design', 'Development', 'Marketing', 'Translation', 'Writing', 'Video', 'Audio', 'Data', 'Support',
+              'Other']
+OFFER_TYPES = ['Task', 'Project', 'Consulting', 'Vacancy', 'Other']
+FIRST_NAMES = ['Alexander', 'Maria', 'Ivan', 'Anna', 'Dmitry', 'Elena', 'Sergey', 'Olga', 'Pavel', 'Daria']
+SURNAMES = ['Ivanov', 'Petrova', 'Smirnov', 'Kuznetsova', 'Popov', 'Sokolova', 'Lebedev', 'Kozlova', 'Novikov']
+
+
+class Generator:
+    def __init__(self, args):
+        self.args = args
+        self.rnd = random.Random(args.seed)
+        self.now: datetime = datetime.fromisoformat(args.now)
+        self.users: List[UUID] = [self.uuid() for _ in range(args.users)]
+        self.categories: List[UUID] = [self.uuid() for _ in CATEGORIES]
+        self.types: List[UUID] = [self.uuid() for _ in OFFER_TYPES]
+        # (offer id, owner index, created_at)
+        self.offers: List[Tuple[UUID, int, datetime]] = []
+        # (executor id, user index, offer index)
+        self.executors: List[Tuple[UUID, int, int]] = []
+        self.chat_sizes: List[int] = []
+
+    def uuid(self) -> UUID:
+        return UUID(int=self.rnd.getrandbits(128), version=4)
+
+    def skewed_user(self) -> int:
+        """Index biased towards the first users, they act as power users"""
+        return int(len(self.users) * self.rnd.random() ** 3)
+
+    def moment(self, days: int) -> datetime:
+        return self.now - timedelta(seconds=self.rnd.randrange(days * 24 * 60 * 60))
+
+    def category_rows(self) -> Iterator[tuple]:
+        yield from zip(self.categories, CATEGORIES)
+
+    def type_rows(self) -> Iterator[tuple]:
+        yield from zip(self.types, OFFER_TYPES)
+
+    def user_rows(self, password: str) -> Iterator[tuple]:
+        for i, user_id in enumerate(self.users):
+            yield user_id, f'user{i}@example.com', password, self.rnd.random() < 0.8
+
+    def personal_data_rows(self) -> Iterator[tuple]:
+        for i, user_id in enumerate(self.users):
+            yield (
+                user_id, self.rnd.choice(FIRST_NAMES), None, self.rnd.choice(SURNAMES),
+                'Bio ' * self.rnd.randrange(0, 40) or None, f'@user{i}',
+            )
+
+    def offer_rows(self) -> Iterator[tuple]:
+        for _ in range(self.args.offers):
+            offer_id, owner, created_at = self.uuid(), self.skewed_user(), self.moment(self.args.days)
+            self.offers.append((offer_id, owner, created_at))
+            yield (
+                offer_id, self.users[owner], f'Offer {len(self.offers)}', 'Description ' * self.rnd.randrange(1, 20),
+                self.rnd.choice(self.categories), self.rnd.choice(self.types), self.rnd.random() < 0.1,
+                self.rnd.random() < 0.3, created_at + timedelta(days=self.rnd.randrange(1, 60)), created_at, 1,
+                created_at,
+            )
+
+    def file_rows(self) -> Iterator[tuple]:
+        for offer_id, _, _ in self.offers:
+            for j in range(min(int(self.rnd.paretovariate(1.5)) - 1, self.args.max_files)):
+                key = f'offers/{offer_id}/file{j}.pdf'
+                yield self.uuid(), offer_id, key, f'File {j}', key
+
+    def executor_count(self, offer_index: int) -> int:
+        if offer_index < self.args.hot_offers:
+            return self.args.max_executors
+        return min(int(self.rnd.paretovariate(1.2)) - 1, self.args.max_executors)
+
+    def executor_rows(self) -> Iterator[tuple]:
+        for offer_index, (offer_id, owner, _) in enumerate(self.offers):
+            count = min(self.executor_count(offer_index), len(self.users) - 1)
+            chosen = set()
+            while len(chosen) < count:
+                user = self.skewed_user() if self.rnd.random() < 0.5 else self.rnd.randrange(len(self.users))
+                if user != owner:
+                    chosen.add(user)
+            for user in sorted(chosen):
+                executor_id = self.uuid()
+                self.executors.append((executor_id, user, offer_index))
+                yield executor_id, self.users[user], offer_id, self.rnd.random() < 0.2
+
+    def plan_chats(self):
+        """Zipf message counts, rank 1 gets `max_messages`, the rest share `messages`"""
+        chats = min(self.args.chats, len(self.executors))
+        weights = [1 / rank ** 1.1 for rank in range(2, chats + 1)]
+        rest = max(self.args.messages - self.args.max_messages, 0) if chats else 0
+        total = sum(weights) or 1
+        self.chat_sizes = [self.args.max_messages] * bool(chats) + [int(rest * w / total) for w in weights]
+
+    def chat_rows(self) -> Iterator[tuple]:
+        executors = self.rnd.sample(self.executors, len(self.chat_sizes))
+        for size, (executor_id, _, offer_index) in zip(self.chat_sizes, executors):
+            offer_id, _, offer_created_at = self.offers[offer_index]
+            chat_id = self.uuid()
+            created_at = offer_created_at + timedelta(hours=1)
+            yield chat_id, f'Chat {offer_id}', offer_id, executor_id, created_at, created_at + timedelta(seconds=size)
+
+    def message_rows(self, chats: List[tuple]) -> Iterator[tuple]:
+        executor_users = {executor_id: user for executor_id, user, _ in self.executors}
+        offer_owners = {offer_id: owner for offer_id, owner, _ in self.offers}
+        for size, (chat_id, _, offer_id, executor_id, created_at, _) in zip(self.chat_sizes, chats):
+            owner = self.users[offer_owners[offer_id]]
+            executor = self.users[executor_users[executor_id]]
+            unread_from = size - self.rnd.randrange(0, 5)
+            for k in range(size):
+                sender, recipient = (owner, executor) if self.rnd.random() < 0.5 else (executor, owner)
+                sent_at = created_at + timedelta(seconds=k + 1)
+                yield (
+                    self.uuid(), sender, recipient, chat_id, f'Message {k}', sent_at,
+                    sent_at + timedelta(seconds=30) if k < unread_from else None,
+                )
+
+
+async def copy(connection, table: str, columns: List[str], records) -> int:
+    counted = Counted(records)
+    started = perf_counter()
+    await connection.copy_records_to_table(table, records=counted, columns=columns)
+    elapsed = perf_counter() - started
+    print(f'{table:<14} {counted.count:>10} rows  {elapsed:7.1f}s  {counted.count / max(elapsed, 1e-9):>10.0f} rows/s')
+    return counted.count
+
+
+class Counted:
+    def __init__(self, records):
+        self.records = records
+        self.count: int = 0
+
+    def __iter__(self):
+        for record in self.records:
+            self.count += 1
+            yield record
+
+
+async def main(args):
+    generator = Generator(args)
+    password = pwd_context.hash(args.password)
+    connection = await asyncpg.connect(
+        host=POSTGRES_HOST, port=POSTGRES_PORT, user=POSTGRES_USER, password=POSTGRES_PASSWORD, database=POSTGRES_DB
+    )
+    started = perf_counter()
+    try:
+        if args.truncate:
+            await connection.execute(f'TRUNCATE {", ".join(TABLES)} CASCADE')
+        async with connection.transaction():
+            await copy(connection, 'categories', ['id', 'name'], generator.category_rows())
+            await copy(connection, 'offer_type', ['id', 'type'], generator.type_rows())
+            await copy(connection, 'users', ['id', 'email', 'password', 'is_verified'], generator.user_rows(password))
+            await copy(connection, 'personal_data', ['id', 'first_name', 'patronymic', 'surname', 'bio', 'tg_nickname'],
+                       generator.personal_data_rows())
+            await copy(connection, 'offers', [
+                'id', 'user_id', 'title', 'description', 'category_id', 'type_id', 'is_anonymous', 'is_closed',
+                'deadline', 'created_at', 'version', 'updated_at',
+            ], generator.offer_rows())
+            await copy(connection, 'offer_files', ['id', 'offer_id', 'link', 'description', 'storage_key'],
+                       generator.file_rows())
+            await copy(connection, 'executors', ['id', 'user_id', 'offer_id', 'is_approved'], generator.executor_rows())
+            generator.plan_chats()
+            chats = list(generator.chat_rows())
+            await copy(connection, 'chats', [
+                'id', 'chat_name', 'offer_id', 'executor_id', 'created_at', 'last_message_at',
+            ], chats)
+            await copy(connection, 'messages', [
+                'id', 'owner_id', 'recipient_id', 'chat_id', 'content', 'created_at', 'read_at',
+            ], generator.message_rows(chats))
+        for table in TABLES:
+            await connection.execute(f'ANALYZE {table}')
+    finally:
+        await connection.close()
+    print(f'done in {perf_counter() - started:.1f}s')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--now', default='2024-01-01T00:00:00', help='newest timestamp, fixed for reproducible data')
+    parser.add_argument('--days', type=int, default=365, help='offers are spread over this many days')
+    parser.add_argument('--users', type=int, default=10000)
+    parser.add_argument('--offers', type=int, default=20000)
+    parser.add_argument('--max-files', type=int, default=50)
+    parser.add_argument('--max-executors', type=int, default=500)
+    parser.add_argument('--hot-offers', type=int, default=5, help='offers that get --max-executors executors')
+    parser.add_argument('--chats', type=int, default=2000)
+    parser.add_argument('--messages', type=int, default=300000, help='total messages, including the busiest chat')
+    parser.add_argument('--max-messages', type=int, default=100000, help='messages in the busiest chat')
+    parser.add_argument('--password', default='seed-password')
+    parser.add_argument('--truncate', action='store_true', help='empty every table first')
+    asyncio.run(main(parser.parse_args()))
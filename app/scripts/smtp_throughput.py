@@ -0,0 +1,65 @@
+"""Measures email delivery throughput against a local SMTP stand-in.
+
+Start a sink that accepts everything, e.g.
+    python -m aiosmtpd -n -l localhost:1025
+then, from the app directory:
+    SMTP_SERVER=localhost SMTP_PORT=1025 SMTP_USE_SSL=false SMTP_PASSWORD= python -m scripts.smtp_throughput -n 500
+
+Sends the same verify emails with a new connection per message (the old task behaviour),
+through a shared pool with one acquire/release per message like `send_email_task`, and in
+batches over one pooled connection like `send_email_batch_task`.
+"""
+from core.config import SMTP_SERVER, SMTP_PORT, SMTP_USE_SSL, SMTP_EMAIL, SMTP_PASSWORD, EMAIL_BATCH_SIZE
+from tasks.smtp_pool import SMTPConnectionPool
+from tasks.message_data import MessageData
+from time import perf_counter
+from uuid import uuid4
+import argparse
+
+
+def payloads(count: int):
+    return [
+        MessageData(
+            subject='Подтверждение личного аккаунта',
+            recipient_email=f'user{i}@example.com',
+            template_type='verify_email',
+            token=uuid4(),
+        ).to_dict() for i in range(count)
+    ]
+
+
+def run(pool_factory, items, batch_size: int, close_each: bool) -> float:
+    started = perf_counter()
+    for i in range(0, len(items), batch_size):
+        pool = pool_factory()
+        with pool.connection() as server:
+            for payload in items[i:i + batch_size]:
+                pool.send(server, MessageData(**payload).get_message)
+        if close_each:
+            pool.close()
+    return perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('-n', type=int, default=200, help='messages per run')
+    args = parser.parse_args()
+
+    def new_pool():
+        return SMTPConnectionPool(SMTP_SERVER, SMTP_PORT, SMTP_EMAIL, SMTP_PASSWORD, use_ssl=SMTP_USE_SSL)
+
+    shared = new_pool()
+    items = payloads(args.n)
+    for name, factory, batch_size, close_each in [
+        ('connection per message', new_pool, 1, True),
+        ('shared pool', lambda: shared, 1, False),
+        (f'pooled, batches of {EMAIL_BATCH_SIZE}', lambda: shared, EMAIL_BATCH_SIZE, False),
+    ]:
+        elapsed = run(factory, items, batch_size, close_each)
+        print(f'{name:<28} {args.n / elapsed:8.1f} msg/s  ({elapsed:.2f}s)')
+    print(f'pooled connections opened: {shared.opened}')
+    shared.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,17 +1,68 @@
-from core.config import SMTP_EMAIL, SMTP_SERVER, SMTP_PASSWORD, SMTP_PORT
+from core.config import SMTP_EMAIL, SMTP_SERVER, SMTP_PASSWORD, SMTP_PORT, SMTP_USE_SSL
+from core.config import SMTP_POOL_SIZE, SMTP_POOL_MAX_MESSAGES, EMAIL_BATCH_SIZE
 from core.config import REDIS_PORT, REDIS_HOST
+from tasks.smtp_pool import SMTPConnectionPool
 from tasks.message_data import MessageData
+from typing import List
 import smtplib
 import celery
 
 REDIS_URL = f'redis://{REDIS_HOST}:{REDIS_PORT}'
 
 celery_app = celery.Celery('tasks', broker=REDIS_URL, backend=REDIS_URL)
+celery_app.conf.update(
+    task_serializer='json',
+    result_serializer='json',
+    accept_content=['json'],
+    task_ignore_result=True,
+)
 
+smtp_pool = SMTPConnectionPool(
+    host=SMTP_SERVER,
+    port=SMTP_PORT,
+    user=SMTP_EMAIL,
+    password=SMTP_PASSWORD,
+    use_ssl=SMTP_USE_SSL,
+    size=SMTP_POOL_SIZE,
+    max_messages=SMTP_POOL_MAX_MESSAGES,
+)
 
-@celery_app.task
-def send_email_task(data: MessageData):
-    server = smtplib.SMTP_SSL(host=SMTP_SERVER, port=SMTP_PORT)
-    server.login(SMTP_EMAIL, SMTP_PASSWORD)
-    server.send_message(data.get_message)
-    server.close()
+# Refused by the server for this message only, smtplib resets the session so the connection stays usable
+MESSAGE_ERRORS = (smtplib.SMTPRecipientsRefused, smtplib.SMTPSenderRefused, smtplib.SMTPDataError)
+
+
+@celery_app.task(
+    autoretry_for=(smtplib.SMTPException, OSError),
+    retry_backoff=True,
+    max_retries=5,
+)
+def send_email_task(payload: dict):
+    """`payload` is `MessageData.to_dict()`, the template is rendered here in the worker"""
+    with smtp_pool.connection() as server:
+        smtp_pool.send(server, MessageData(**payload).get_message)
+
+
+
+@celery_app.task(bind=True, max_retries=5)
+def send_email_batch_task(self, payloads: List[dict]):
+    """Sends up to EMAIL_BATCH_SIZE messages over one pooled connection.
+
+    A message the server refuses is handed over to `send_email_task` with its own retries
+    and the batch goes on. If the connection fails, only the unsent tail is retried.
+    """
+    done = 0
+    try:
+        with smtp_pool.connection() as server:
+            for payload in payloads:
+                try:
+                    smtp_pool.send(server, MessageData(**payload).get_message)
+                except MESSAGE_ERRORS:
+                    send_email_task.delay(payload)
+                done += 1
+    except (smtplib.SMTPException, OSError) as e:
+        raise self.retry(args=[payloads[done:]], exc=e, countdown=2 ** self.request.retries)
+
+
+def enqueue_emails(payloads: List[dict]):
+    for i in range(0, len(payloads), EMAIL_BATCH_SIZE):
+        send_email_batch_task.delay(payloads[i:i + EMAIL_BATCH_SIZE])
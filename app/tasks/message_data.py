@@ -15,6 +15,16 @@ class MessageData:
         self.__template_type: Literal['verify_email', 'password_update'] = kwargs.get('template_type')
         self.__token: str = kwargs.get('token')
 
+    def to_dict(self) -> dict:
+        """JSON-serializable task payload, `MessageData(**payload)` restores it in the worker"""
+        return {
+            'from_addr': self.__from_addr,
+            'subject': self.__subject,
+            'recipient_email': self.__recipient_email,
+            'template_type': self.__template_type,
+            'token': self.__token.__str__(),
+        }
+
     @property
     def template(self) -> str:
         return self.templates[self.__template_type](
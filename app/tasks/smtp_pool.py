@@ -0,0 +1,104 @@
+from contextlib import contextmanager
+from time import monotonic
+from typing import Optional
+import smtplib
+import queue
+
+
+class SMTPConnectionPool:
+    """Logged-in SMTP connections reused across tasks of one worker process.
+
+    Connections are opened lazily (after the Celery fork) and handed out LIFO so the
+    warmest one is reused. A connection idle for longer than `idle_check_seconds` is
+    probed with NOOP first, one used when an exception was raised or that sent
+    `max_messages` messages is closed.
+    """
+    def __init__(
+            self,
+            host: str,
+            port: int,
+            user: Optional[str],
+            password: Optional[str],
+            use_ssl: bool = True,
+            size: int = 2,
+            max_messages: int = 500,
+            idle_check_seconds: float = 30.0,
+            timeout: float = 30.0,
+    ):
+        self.host: str = host
+        self.port: int = port
+        self.use_ssl: bool = use_ssl
+        self.max_messages: int = max_messages
+        self.idle_check_seconds: float = idle_check_seconds
+        self.timeout: float = timeout
+        self.__user: Optional[str] = user
+        self.__password: Optional[str] = password
+        self.__idle: queue.LifoQueue = queue.LifoQueue(maxsize=size)
+        self.opened: int = 0
+        self.sent: int = 0
+
+    def __connect(self) -> smtplib.SMTP:
+        smtp_class = smtplib.SMTP_SSL if self.use_ssl else smtplib.SMTP
+        server = smtp_class(host=self.host, port=self.port, timeout=self.timeout)
+        if self.__password:
+            server.login(self.__user, self.__password)
+        self.opened += 1
+        server.messages_sent = 0
+        return server
+
+    def __acquire(self) -> smtplib.SMTP:
+        while True:
+            try:
+                server, released_at = self.__idle.get_nowait()
+            except queue.Empty:
+                return self.__connect()
+            if monotonic() - released_at < self.idle_check_seconds:
+                return server
+            try:
+                if server.noop()[0] == 250:
+                    return server
+            except (smtplib.SMTPException, OSError):
+                # A dead socket raises ConnectionResetError / BrokenPipeError rather than SMTPException
+                pass
+            self.__close(server)
+
+    def __release(self, server: smtplib.SMTP):
+        if server.messages_sent >= self.max_messages:
+            self.__close(server)
+            return
+        try:
+            self.__idle.put_nowait((server, monotonic()))
+        except queue.Full:
+            self.__close(server)
+
+    @staticmethod
+    def __close(server: smtplib.SMTP):
+        try:
+            server.quit()
+        except (smtplib.SMTPException, OSError):
+            server.close()
+
+    @contextmanager
+    def connection(self):
+        server = self.__acquire()
+        try:
+            yield server
+        except BaseException:
+            # The connection may be mid-transaction, never hand it back to the pool
+            self.__close(server)
+            raise
+        else:
+            self.__release(server)
+
+    def send(self, server: smtplib.SMTP, message):
+        server.send_message(message)
+        server.messages_sent += 1
+        self.sent += 1
+
+    def close(self):
+        while True:
+            try:
+                server, _ = self.__idle.get_nowait()
+            except queue.Empty:
+                return
+            self.__close(server)